@@ -17,3 +17,5 @@ We will be asking the system for some functionality and using
 reverse matching it will look for most appropriate example and
 fill out the details that the user will propose
 """
+
+__version__ = "0.1.0"
@@ -1,13 +1,33 @@
+import collections
+import io
+import itertools
+import os
+import pathlib
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Iterable, Iterator
+
 from flang.runtime import ProjectParsingRuntime
 from flang.structures import (
     BaseFlangInputReader,
+    FileTreeScanner,
     FlangAbstractMatchObject,
+    FlangDirectoryMatchObject,
     FlangFileInputReader,
     FlangFileMatch,
+    FlangFlatFileMatchObject,
     FlangMatchObject,
+    FlangSpanMatchObject,
+    FlangStreamInputReader,
     FlangTextInputReader,
     IntermediateFileObject,
     PossibleRootFlangMatch,
+    number_match_tree,
 )
 
 
@@ -15,9 +35,86 @@ class FlangProjectAnalyzer:
     def __init__(self, project_construct: ProjectParsingRuntime) -> None:
         self.project_construct: ProjectParsingRuntime = project_construct
 
-    def backward(self, spec: FlangMatchObject) -> BaseFlangInputReader:
-        raise NotImplementedError
-        return
+    def backward(
+        self,
+        spec: FlangMatchObject,
+        output: io.TextIOBase | str | os.PathLike | None = None,
+        jobs: int = 8,
+    ) -> BaseFlangInputReader | None:
+        """
+        Renders a match tree back to its source. Text is written piece by piece to
+        the `output` stream, or returned as a reader when there is no `output`.
+        Matched files and directories are written to the `output` path, with flat
+        files written by a pool of `jobs` threads
+        """
+        if isinstance(spec, FlangFileMatch):
+            assert isinstance(
+                output, str | os.PathLike
+            ), "Matched files can only be written to a path"
+            self._write_file_tree(spec, pathlib.Path(output), jobs)
+            return None
+
+        if output is None:
+            buffer = io.StringIO()
+            buffer.writelines(self.iter_backward(spec))
+            return FlangTextInputReader(buffer)
+
+        assert not isinstance(output, str | os.PathLike), "Text is written to a stream"
+        output.writelines(self.iter_backward(spec))
+        return None
+
+    @staticmethod
+    def iter_backward(spec: FlangMatchObject) -> Iterator[str]:
+        """Yields the text of a match tree in order, one matched text at a time"""
+        # explicit stack, match trees of nested constructs may be deeper than the
+        # recursion limit
+        stack = [spec]
+
+        while stack:
+            match_object = stack.pop()
+
+            if isinstance(match_object.content, list):
+                stack.extend(reversed(match_object.content))
+            elif match_object.content:
+                yield match_object.content
+
+    def _write_file_tree(
+        self, spec: FlangFileMatch, path: pathlib.Path, jobs: int
+    ) -> None:
+        # at most this many files wait for a worker, so their trees can be released
+        max_pending = 2 * jobs
+        pending: collections.deque[Future] = collections.deque()
+        stack: list[tuple[FlangFileMatch, pathlib.Path]] = [(spec, path)]
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while stack:
+                match_object, target = stack.pop()
+
+                if isinstance(match_object, FlangDirectoryMatchObject):
+                    target.mkdir(parents=True, exist_ok=True)
+                    stack.extend(
+                        (child, target / child.filename)
+                        for child in reversed(match_object.content)
+                    )
+                    continue
+
+                if len(pending) >= max_pending:
+                    pending.popleft().result()
+
+                pending.append(
+                    executor.submit(self._write_flat_file, match_object, target)
+                )
+
+            for future in pending:
+                future.result()
+
+    def _write_flat_file(
+        self, spec: FlangFlatFileMatchObject, path: pathlib.Path
+    ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(path, "w") as f:
+            f.writelines(self.iter_backward(spec))
 
     def _forward(self, reader: BaseFlangInputReader) -> PossibleRootFlangMatch | None:
         match_objects, _ = self.project_construct.match(reader)
@@ -52,7 +149,189 @@ class FlangProjectAnalyzer:
         reader = FlangTextInputReader(sample)
         return self.forward(reader)
 
-    def forward_filename(self, path: str) -> PossibleRootFlangMatch | None:
-        file_object = IntermediateFileObject(path)
+    def forward_filename(
+        self, path: str, ignore_patterns: Iterable[str] = ()
+    ) -> PossibleRootFlangMatch | None:
+        scanner = FileTreeScanner(ignore_patterns)
+        file_object = IntermediateFileObject(path, scanner=scanner)
         reader = FlangFileInputReader([file_object], filename=file_object.filename)
         return self.forward(reader)
+
+    def iter_forward(self, reader: BaseFlangInputReader) -> Iterator[FlangMatchObject]:
+        return self.project_construct.iter_match(reader)
+
+    def iter_forward_stream(
+        self, stream: io.TextIOBase, chunk_size: int = 64 * 1024
+    ) -> Iterator[FlangMatchObject]:
+        reader = FlangStreamInputReader(stream, chunk_size=chunk_size)
+        return self.iter_forward(reader)
+
+    def forward_many(
+        self, inputs: Iterable[str | os.PathLike], jobs: int | None = None
+    ) -> Iterator[tuple[str | os.PathLike, PossibleRootFlangMatch | None | Exception]]:
+        """
+        Matches many inputs against the template in `jobs` worker processes (all
+        cores by default). Strings are matched as text and path-like objects as
+        files or directories. Yields (input, result or raised error) pairs in the
+        order in which the inputs finish
+        """
+        if jobs == 1:
+            for sample in inputs:
+                try:
+                    yield sample, self._forward_input(sample)
+                except Exception as e:
+                    yield sample, e
+            return
+
+        inputs = iter(inputs)
+        # inputs are submitted as workers become free, not all at once
+        max_pending = 2 * (jobs or os.cpu_count() or 1)
+        executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_forward_worker,
+            initargs=(self.project_construct,),
+        )
+        pending: dict[Future, str | os.PathLike] = {}
+
+        try:
+            while True:
+                for sample in itertools.islice(inputs, max_pending - len(pending)):
+                    pending[executor.submit(_forward_in_worker, sample)] = sample
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    sample = pending.pop(future)
+                    error = future.exception()
+                    yield sample, future.result() if error is None else error
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _forward_input(self, sample: str | os.PathLike) -> PossibleRootFlangMatch | None:
+        if isinstance(sample, os.PathLike):
+            return self.forward_filename(os.fspath(sample))
+
+        return self.forward_string(sample)
+
+    def forward_edit(
+        self,
+        previous_match: FlangAbstractMatchObject,
+        offset: int,
+        deleted_length: int,
+        inserted_text: str,
+    ) -> PossibleRootFlangMatch | None:
+        """
+        Matches the text of `previous_match` after replacing `deleted_length`
+        characters at `offset` with `inserted_text`. Only the smallest subtree that
+        strictly encloses the edit is matched again, all other match objects are
+        reused. Falls back to matching the whole text when the new subtree does not
+        fit in place of the old one
+        """
+        old_text = "".join(it.get_raw_content() for it in previous_match.content)
+        edit_end = offset + deleted_length
+
+        if not 0 <= offset <= edit_end <= len(old_text):
+            raise ValueError(
+                f"Edit [{offset}, {edit_end}) is out of the text range "
+                f"[0, {len(old_text)}]"
+            )
+
+        new_text = old_text[:offset] + inserted_text + old_text[edit_end:]
+        length_delta = len(inserted_text) - deleted_length
+        path = self._find_enclosing_path(previous_match, offset, edit_end)
+        runtime = self.project_construct
+
+        # objects shared with the new tree keep the identifiers of the previous one
+        for match_object in previous_match.content:
+            if isinstance(match_object, FlangSpanMatchObject):
+                match_object.source.numbering.number()
+
+        # an edit inside a choice alternative may change the chosen alternative, so
+        # only subtrees above the first such object can be matched again
+        for depth, (parent, index, _) in enumerate(path):
+            if not runtime.can_rematch_in_place(parent.content[index]):
+                del path[depth:]
+                break
+
+        # try the smallest subtree first, then its ancestors
+        for depth in reversed(range(len(path))):
+            parent, index, start = path[depth]
+            match_object = parent.content[index]
+            new_match_object = runtime.rematch(
+                match_object, new_text, start, len(match_object) + length_delta
+            )
+
+            if new_match_object is not None:
+                new_root = self._replace_in_tree(
+                    path[: depth + 1], new_match_object, length_delta
+                )
+                # identifiers are numbered as if the new text was matched from scratch
+                return number_match_tree(new_root, {})  # type: ignore
+
+        return self.forward_string(new_text)
+
+    @staticmethod
+    def _find_enclosing_path(
+        root: FlangMatchObject, edit_start: int, edit_end: int
+    ) -> list[tuple[FlangMatchObject, int, int]]:
+        """
+        Returns (parent, child index, child offset) for every match object that
+        strictly encloses the edited range, from the root down. Edits touching the
+        boundary of an object may change how its neighbours match, so it is excluded
+        """
+        path = []
+        match_object = root
+
+        while isinstance(match_object.content, list):
+            position = path[-1][2] if path else 0
+
+            for index, child in enumerate(match_object.content):
+                end = position + len(child)
+
+                if position < edit_start and edit_end < end:
+                    path.append((match_object, index, position))
+                    match_object = child
+                    break
+
+                position = end
+            else:
+                break
+
+        return path
+
+    @staticmethod
+    def _replace_in_tree(
+        path: list[tuple[FlangMatchObject, int, int]],
+        new_match_object: FlangMatchObject,
+        length_delta: int,
+    ) -> PossibleRootFlangMatch:
+        # ancestors are copied, so the previous tree stays valid
+        for parent, index, _ in reversed(path):
+            content = list(parent.content)
+            content[index] = new_match_object
+            new_match_object = parent.replace_content(content, length_delta)
+
+        assert isinstance(new_match_object, FlangAbstractMatchObject)
+        return new_match_object
+
+
+# state of a worker process of `FlangProjectAnalyzer.forward_many`
+_worker_analyzer: FlangProjectAnalyzer | None = None
+
+
+def _init_forward_worker(runtime: ProjectParsingRuntime) -> None:
+    global _worker_analyzer
+
+    # worker processes cannot start their own pools
+    runtime.jobs = 1
+    _worker_analyzer = FlangProjectAnalyzer(runtime)
+
+
+def _forward_in_worker(sample: str | os.PathLike) -> PossibleRootFlangMatch | None:
+    analyzer = _worker_analyzer
+    assert analyzer is not None, "Worker process was not initialized"
+
+    return analyzer._forward_input(sample)
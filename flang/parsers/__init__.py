@@ -1,3 +1,4 @@
 from .flang_xml_parser import FlangXMLParser
+from .template_cache import CompiledTemplateCache
 
-__all__ = ["FlangXMLParser"]
+__all__ = ["CompiledTemplateCache", "FlangXMLParser"]
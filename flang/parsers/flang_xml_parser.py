@@ -1,23 +1,43 @@
 import os
+import re
 import xml.etree.ElementTree as ET
 
 from flang.runtime import ProjectParsingRuntime
 from flang.structures import FlangConstruct
 from flang.utils.attributes import get_possible_construct_attributes
+from flang.utils.common import BUILTIN_PATTERNS
 from flang.utils.exceptions import UnknownAttributeException
 
+from .template_cache import CompiledTemplateCache
+
 
 class FlangXMLParser:
+    def __init__(self, cache: CompiledTemplateCache | None = None) -> None:
+        self.cache = cache
+
     @staticmethod
     def get_file_from_path(location: str):
         return location.split(":")[0]
 
+    @staticmethod
+    def precompile_construct(construct: FlangConstruct) -> None:
+        construct_text = construct.get_attrib("value", construct.text)
+
+        match construct.name:
+            case "regex":
+                assert isinstance(construct_text, str)
+                construct.pattern = re.compile(construct_text.format(**BUILTIN_PATTERNS))
+            case "text":
+                assert isinstance(construct_text, str)
+                construct.literal = construct_text
+
     def _build_tree(
         self,
         element: ET.Element,
         flang_object: ProjectParsingRuntime,
         validate_attributes: bool,
         location: str = "",
+        precompile: bool = True,
     ) -> FlangConstruct:
         if element_name := element.attrib.get("name"):
             location = flang_object.generate_symbol_for_construct(
@@ -46,6 +66,7 @@ class FlangXMLParser:
                 flang_object,
                 validate_attributes=validate_attributes,
                 location=location,
+                precompile=precompile,
             )
             for child in element
         ]
@@ -60,22 +81,53 @@ class FlangXMLParser:
             text=element.text or element.attrib.get("value"),
             location=location,
         )
+
+        if precompile:
+            self.precompile_construct(construct)
+
         flang_object.add_symbol(location, construct)
 
         return construct
 
     def parse_text(
-        self, text: str, path: str = "", validate_attributes: bool = False
+        self,
+        text: str,
+        path: str = "",
+        validate_attributes: bool = False,
+        precompile: bool = True,
     ) -> ProjectParsingRuntime:
+        """
+        With `precompile` disabled, regex and text constructs are resolved on every
+        match attempt (the legacy behaviour, kept for comparing timings)
+        """
         path = path or os.getcwd()
+        cache_key = None
+
+        if self.cache is not None:
+            cache_key = self.cache.get_key(
+                text,
+                path=path,
+                validate_attributes=validate_attributes,
+                precompile=precompile,
+            )
+
+            if (cached_object := self.cache.load(cache_key)) is not None:
+                return cached_object
 
         processed_xml = ET.fromstring(text)
         flang_object = ProjectParsingRuntime(path=path)
-        construct = self._build_tree(processed_xml, flang_object, validate_attributes)
+        construct = self._build_tree(
+            processed_xml, flang_object, validate_attributes, precompile=precompile
+        )
         flang_object.root = construct.location
 
+        if self.cache is not None and cache_key is not None:
+            # compile before storing, so loading from cache skips this step
+            flang_object.compile()
+            self.cache.store(cache_key, flang_object)
+
         return flang_object
 
-    def parse_file(self, filepath: str):
+    def parse_file(self, filepath: str, precompile: bool = True):
         with open(filepath) as f:
-            return self.parse_text(f.read(), filepath)
+            return self.parse_text(f.read(), filepath, precompile=precompile)
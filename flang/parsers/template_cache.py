@@ -0,0 +1,90 @@
+import dataclasses
+import hashlib
+import os
+import pathlib
+import pickle
+import sys
+import tempfile
+
+import flang
+from flang.runtime import CompiledGrammar, ProjectParsingRuntime
+from flang.utils.common import get_cache_root, get_engine_fingerprint
+
+
+class CompiledTemplateCache:
+    """
+    Persistent cache of compiled templates. Entries are pickled `ProjectParsingRuntime`
+    objects (with the compiled grammar and precompiled patterns) keyed by a hash of the
+    template content, parsing options and engine sources. Unreadable entries and
+    entries with a different layout are removed and the template is compiled again
+    """
+
+    def __init__(self, cache_dir: str | pathlib.Path | None = None) -> None:
+        self.cache_dir = (
+            pathlib.Path(cache_dir) if cache_dir else get_cache_root() / "templates"
+        )
+
+    @staticmethod
+    def get_key(text: str, **options) -> str:
+        engine_version = "{}/{}/{}.{}".format(
+            flang.__version__, get_engine_fingerprint(), *sys.version_info[:2]
+        )
+        key_source = "\0".join(
+            [engine_version, *(f"{k}={v!r}" for k, v in sorted(options.items())), text]
+        )
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def get_entry_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f"{key}.pickle"
+
+    def load(self, key: str) -> ProjectParsingRuntime | None:
+        entry_path = self.get_entry_path(key)
+
+        try:
+            with open(entry_path, "rb") as f:
+                runtime = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        if not self._has_current_layout(runtime):
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        return runtime
+
+    @staticmethod
+    def _has_current_layout(runtime: object) -> bool:
+        if not isinstance(runtime, ProjectParsingRuntime):
+            return False
+
+        expected_attributes = vars(ProjectParsingRuntime(path="")).keys()
+
+        if vars(runtime).keys() != expected_attributes:
+            return False
+
+        grammar = runtime._grammar
+
+        return grammar is None or (
+            isinstance(grammar, CompiledGrammar)
+            and all(hasattr(grammar, field.name) for field in dataclasses.fields(grammar))
+        )
+
+    def store(self, key: str, runtime: ProjectParsingRuntime) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first so concurrent readers never see partial entries
+        fd, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(runtime, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.get_entry_path(key))
+        except BaseException:
+            pathlib.Path(temporary_path).unlink(missing_ok=True)
+            raise
+
+    def clear(self) -> None:
+        for entry_path in self.cache_dir.glob("*.pickle"):
+            entry_path.unlink(missing_ok=True)
@@ -1,4 +1,19 @@
+from .compiled_grammar import ChoiceMode, CompiledGrammar, ConstructKind
+from .match_context import MatchContext, MatchFailure
+from .memo import MemoStatistics, PackratMemoTable
 from .project_parsing_runtime import ProjectParsingRuntime
+from .result_store import MatchResultStore
 from .spec_evaluation_runtime import SpecEvaluationRuntime
 
-__all__ = ["ProjectParsingRuntime", "SpecEvaluationRuntime"]
+__all__ = [
+    "ChoiceMode",
+    "CompiledGrammar",
+    "ConstructKind",
+    "MatchContext",
+    "MatchFailure",
+    "MatchResultStore",
+    "MemoStatistics",
+    "PackratMemoTable",
+    "ProjectParsingRuntime",
+    "SpecEvaluationRuntime",
+]
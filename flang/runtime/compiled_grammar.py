@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import dataclasses
+import enum
+import functools
+import hashlib
+import re
+from typing import Callable
+
+import flang
+from flang.structures import FlangConstruct
+from flang.utils.exceptions import SymbolNotFoundError
+from flang.utils.regex_analysis import (
+    FirstChars,
+    get_pattern_first_chars,
+    has_group_references,
+    is_pattern_ascii_only,
+)
+
+NO_TARGET = -1
+
+
+class ChoiceMode(enum.Enum):
+    # commit to the first alternative that matches (PEG ordered choice)
+    FIRST = "first"
+    # try every alternative and pick the one consuming most of the input
+    LONGEST = "longest"
+
+
+class ConstructKind(enum.IntEnum):
+    """How the matcher handles a construct, resolved from its name at compile time"""
+
+    UNKNOWN = 0
+    SEQUENCE = enum.auto()
+    CHOICE = enum.auto()
+    USE = enum.auto()
+    EVENT = enum.auto()
+    REGEX = enum.auto()
+    TEXT = enum.auto()
+    FILE = enum.auto()
+
+
+_CONSTRUCT_KINDS = {
+    "sequence": ConstructKind.SEQUENCE,
+    "choice": ConstructKind.CHOICE,
+    "use": ConstructKind.USE,
+    "event": ConstructKind.EVENT,
+    "regex": ConstructKind.REGEX,
+    "text": ConstructKind.TEXT,
+    "file": ConstructKind.FILE,
+}
+
+
+def _compute_first_sets(
+    names: tuple[str, ...],
+    children: tuple[tuple[int, ...], ...],
+    optional: tuple[bool, ...],
+    use_targets: tuple[int, ...],
+    patterns: tuple[re.Pattern | None, ...],
+    literals: tuple[str | None, ...],
+) -> tuple[tuple[FirstChars, ...], tuple[bool, ...]]:
+    """
+    Returns FIRST sets and nullability (can a construct, including its "optional"
+    attribute, match no text) for all constructs. Constructs may refer to each
+    other through "use", so the values are computed as a fixed point
+    """
+    count = len(names)
+    unknown = [False] * count
+    chars: list[frozenset[str]] = [frozenset()] * count
+    # `body_nullable` ignores the "optional" attribute, which "use" does not apply
+    body_nullable = [False] * count
+    nullable = list(optional)
+
+    def compute(construct_id: int) -> tuple[bool, frozenset[str], bool]:
+        match names[construct_id]:
+            case "text":
+                literal = literals[construct_id]
+
+                if literal is None:
+                    return True, frozenset(), False
+                if not literal:
+                    return False, frozenset(), True
+                return False, frozenset(literal[0]), False
+            case "regex":
+                pattern = patterns[construct_id]
+                pattern_chars = pattern and get_pattern_first_chars(pattern)
+
+                if pattern_chars is None:
+                    return True, frozenset(), False
+                return False, pattern_chars, False
+            case "sequence":
+                is_unknown, sequence_chars = False, frozenset()
+
+                for child_id in children[construct_id]:
+                    is_unknown = is_unknown or unknown[child_id]
+                    sequence_chars |= chars[child_id]
+
+                    if not nullable[child_id]:
+                        return is_unknown, sequence_chars, False
+
+                return is_unknown, sequence_chars, True
+            case "choice":
+                child_ids = children[construct_id]
+                return (
+                    any(unknown[i] for i in child_ids),
+                    frozenset().union(*(chars[i] for i in child_ids)),
+                    any(nullable[i] for i in child_ids),
+                )
+            case "use":
+                target_id = use_targets[construct_id]
+
+                if target_id == NO_TARGET:
+                    return True, frozenset(), False
+                return unknown[target_id], chars[target_id], body_nullable[target_id]
+            case _:
+                return True, frozenset(), False
+
+    changed = True
+
+    while changed:
+        changed = False
+
+        for construct_id in range(count):
+            value = compute(construct_id)
+            current = (
+                unknown[construct_id],
+                chars[construct_id],
+                body_nullable[construct_id],
+            )
+
+            if value != current:
+                (
+                    unknown[construct_id],
+                    chars[construct_id],
+                    body_nullable[construct_id],
+                ) = value
+                nullable[construct_id] = value[2] or optional[construct_id]
+                changed = True
+
+    first_chars = tuple(
+        None if is_unknown else first for is_unknown, first in zip(unknown, chars)
+    )
+    return first_chars, tuple(nullable)
+
+
+def _get_leaf_regex(
+    construct_id: int,
+    kinds: tuple[ConstructKind, ...],
+    patterns: tuple[re.Pattern | None, ...],
+    literals: tuple[str | None, ...],
+) -> str | None:
+    """
+    Regex matching the same text as a "text" or "regex" construct, which can be
+    embedded into a bigger pattern. None if there is no such regex
+    """
+    match kinds[construct_id]:
+        case ConstructKind.TEXT:
+            literal = literals[construct_id]
+            return None if literal is None else re.escape(literal)
+        case ConstructKind.REGEX:
+            pattern = patterns[construct_id]
+
+            # flags cannot be set in the middle of a pattern
+            if (
+                pattern is None
+                or pattern.flags != re.UNICODE
+                or has_group_references(pattern)
+            ):
+                return None
+            return pattern.pattern
+        case _:
+            return None
+
+
+def _fuse_sequence(
+    construct_id: int,
+    kinds: tuple[ConstructKind, ...],
+    children: tuple[tuple[int, ...], ...],
+    multi: tuple[bool, ...],
+    optional: tuple[bool, ...],
+    patterns: tuple[re.Pattern | None, ...],
+    literals: tuple[str | None, ...],
+) -> re.Pattern | None:
+    """
+    Compiles a sequence of "text" and "regex" constructs into one pattern with a
+    group named "_<child id>" for every child. Children are atomic groups, so the
+    pattern does not backtrack into an earlier child, just like the matcher
+    """
+    child_ids = children[construct_id]
+
+    if kinds[construct_id] is not ConstructKind.SEQUENCE or not child_ids:
+        return None
+
+    parts = []
+
+    for child_id in child_ids:
+        child_regex = _get_leaf_regex(child_id, kinds, patterns, literals)
+
+        if child_regex is None or multi[child_id]:
+            return None
+
+        part = f"(?P<_{child_id}>{child_regex})"
+        parts.append(f"(?>{part}?)" if optional[child_id] else f"(?>{part})")
+
+    try:
+        return re.compile("".join(parts))
+    except re.error:
+        # f.e. the same group name is used by two of the children
+        return None
+
+
+def _compile_repetition(
+    construct_id: int,
+    kinds: tuple[ConstructKind, ...],
+    multi: tuple[bool, ...],
+    patterns: tuple[re.Pattern | None, ...],
+    literals: tuple[str | None, ...],
+) -> re.Pattern | None:
+    """
+    Pattern scanning the repetitions of a multi "text" or "regex" construct: all
+    repeated literals at once or a single occurence of a regex
+    """
+    if not multi[construct_id]:
+        return None
+
+    match kinds[construct_id]:
+        case ConstructKind.TEXT:
+            literal = literals[construct_id]
+            return re.compile(f"(?:{re.escape(literal)})*") if literal else None
+        case ConstructKind.REGEX:
+            return patterns[construct_id]
+        case _:
+            return None
+
+
+def _compile_literal_choice(
+    construct_id: int,
+    kinds: tuple[ConstructKind, ...],
+    children: tuple[tuple[int, ...], ...],
+    literals: tuple[str | None, ...],
+) -> tuple[dict[ChoiceMode, re.Pattern], dict[str, int]] | None:
+    """
+    Compiles a choice of "text" constructs into an alternation of their literals
+    for every choice mode, along with the children that literals belong to. For
+    ChoiceMode.FIRST the literals keep their order, for ChoiceMode.LONGEST they
+    are sorted by length (on a tie the earlier child wins in both cases)
+    """
+    child_ids = children[construct_id]
+
+    if kinds[construct_id] is not ConstructKind.CHOICE or not child_ids:
+        return None
+
+    literal_ids: dict[str, int] = {}
+
+    for child_id in child_ids:
+        literal = literals[child_id]
+
+        if kinds[child_id] is not ConstructKind.TEXT or literal is None:
+            return None
+
+        literal_ids.setdefault(literal, child_id)
+
+    ordered_literals = {
+        ChoiceMode.FIRST: list(literal_ids),
+        ChoiceMode.LONGEST: sorted(literal_ids, key=len, reverse=True),
+    }
+    patterns = {
+        mode: re.compile("|".join(map(re.escape, mode_literals)))
+        for mode, mode_literals in ordered_literals.items()
+    }
+    return patterns, literal_ids
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledGrammar:
+    """
+    Flat, array-backed form of the symbol table used by the matcher. Every construct
+    gets an integer id and all of its properties are stored in tuples indexed by
+    that id, so matching does not go through string lookups or attribute parsing
+    """
+
+    root: int
+    ids: dict[str, int]
+    locations: tuple[str, ...]
+    names: tuple[str, ...]
+    kinds: tuple[ConstructKind, ...]
+    children: tuple[tuple[int, ...], ...]
+    # NO_TARGET for the root and for constructs that are only reachable by "use"
+    parents: tuple[int, ...]
+    multi: tuple[bool, ...]
+    optional: tuple[bool, ...]
+    visible: tuple[bool, ...]
+    use_targets: tuple[int, ...]
+    patterns: tuple[re.Pattern | None, ...]
+    literals: tuple[str | None, ...]
+    file_patterns: tuple[tuple[str, str] | None, ...]
+    # `None` means that the runtime default is used
+    choice_modes: tuple[ChoiceMode | None, ...]
+    first_chars: tuple[FirstChars, ...]
+    nullable: tuple[bool, ...]
+    # sequences of "text" and "regex" constructs matched with a single pattern and
+    # numbers of the groups of their children
+    fused_patterns: tuple[re.Pattern | None, ...]
+    fused_groups: tuple[tuple[int, ...], ...]
+    # choices of "text" constructs matched with a single pattern (one per choice
+    # mode) and ids of the children matching a given literal
+    literal_choices: tuple[dict[ChoiceMode, re.Pattern] | None, ...]
+    literal_choice_ids: tuple[dict[str, int] | None, ...]
+    # multi "text" and "regex" constructs matched without trying every repetition
+    # as a separate construct
+    repeat_patterns: tuple[re.Pattern | None, ...]
+    # all patterns run on readers can run on the bytes of a memory-mapped file
+    bytes_safe: bool
+    constructs: tuple[FlangConstruct, ...]
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """Hash of everything that affects matching, stable between processes"""
+        description = repr(
+            (
+                flang.__version__,
+                self.root,
+                self.locations,
+                self.names,
+                self.children,
+                self.multi,
+                self.optional,
+                self.use_targets,
+                tuple(p and (p.pattern, p.flags) for p in self.patterns),
+                self.literals,
+                self.file_patterns,
+                tuple(mode and mode.value for mode in self.choice_modes),
+            )
+        )
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def can_start_with(self, construct_id: int, char: str) -> bool:
+        """
+        Cheap check if the construct may match at a position starting with `char`
+        (empty at the end of input). False is definitive, True means "maybe"
+        """
+        if self.nullable[construct_id]:
+            return True
+
+        first_chars = self.first_chars[construct_id]
+        return first_chars is None or char in first_chars
+
+    @classmethod
+    def build(
+        cls,
+        symbol_table: dict[str, FlangConstruct],
+        root: str,
+        resolve_reference: Callable[[str, str], FlangConstruct],
+    ) -> CompiledGrammar:
+        constructs = tuple(symbol_table.values())
+        ids = {construct.location: i for i, construct in enumerate(constructs)}
+
+        visible = tuple(c.get_bool_attrib("visible", True) for c in constructs)
+        children = tuple(
+            tuple(ids[child] for child in c.children if visible[ids[child]])
+            for c in constructs
+        )
+
+        parents = [NO_TARGET] * len(constructs)
+
+        for parent_id, child_ids in enumerate(children):
+            for child_id in child_ids:
+                parents[child_id] = parent_id
+
+        use_targets = []
+        file_patterns = []
+        choice_modes = []
+
+        for construct in constructs:
+            target = NO_TARGET
+
+            if construct.name == "use":
+                try:
+                    target_construct = resolve_reference(
+                        construct.get_attrib("ref"), construct.location
+                    )
+                    target = ids[target_construct.location]
+                except SymbolNotFoundError:
+                    pass
+
+            use_targets.append(target)
+
+            if construct.name == "file":
+                pattern = construct.get_attrib("pattern")
+                variant = construct.get_attrib("variant", "filename")
+                file_patterns.append((pattern, variant))
+            else:
+                file_patterns.append(None)
+
+            choice_mode = construct.get_attrib("mode")
+            choice_modes.append(
+                ChoiceMode(choice_mode)
+                if construct.name == "choice" and choice_mode
+                else None
+            )
+
+        names = tuple(c.name for c in constructs)
+        optional = tuple(c.get_bool_attrib("optional") for c in constructs)
+        patterns = tuple(c.pattern for c in constructs)
+        literals = tuple(c.literal for c in constructs)
+        first_chars, nullable = _compute_first_sets(
+            names, children, optional, tuple(use_targets), patterns, literals
+        )
+        kinds = tuple(_CONSTRUCT_KINDS.get(name, ConstructKind.UNKNOWN) for name in names)
+        multi = tuple(c.get_bool_attrib("multi") for c in constructs)
+        fused_patterns = tuple(
+            _fuse_sequence(i, kinds, children, multi, optional, patterns, literals)
+            for i in range(len(constructs))
+        )
+        fused_groups = tuple(
+            (
+                ()
+                if pattern is None
+                else tuple(pattern.groupindex[f"_{i}"] for i in child_ids)
+            )
+            for pattern, child_ids in zip(fused_patterns, children)
+        )
+        literal_choices = [
+            _compile_literal_choice(i, kinds, children, literals)
+            for i in range(len(constructs))
+        ]
+        reader_patterns = [
+            pattern
+            for kind, pattern in zip(kinds, patterns)
+            if kind is ConstructKind.REGEX
+        ] + [
+            pattern
+            for literal_choice in literal_choices
+            if literal_choice is not None
+            for pattern in literal_choice[0].values()
+        ]
+
+        return cls(
+            root=ids[root],
+            ids=ids,
+            locations=tuple(c.location for c in constructs),
+            names=names,
+            kinds=kinds,
+            children=children,
+            parents=tuple(parents),
+            multi=multi,
+            optional=optional,
+            visible=visible,
+            use_targets=tuple(use_targets),
+            patterns=patterns,
+            literals=literals,
+            file_patterns=tuple(file_patterns),
+            choice_modes=tuple(choice_modes),
+            first_chars=first_chars,
+            nullable=nullable,
+            fused_patterns=fused_patterns,
+            fused_groups=fused_groups,
+            literal_choices=tuple(it and it[0] for it in literal_choices),
+            literal_choice_ids=tuple(it and it[1] for it in literal_choices),
+            repeat_patterns=tuple(
+                _compile_repetition(i, kinds, multi, patterns, literals)
+                for i in range(len(constructs))
+            ),
+            bytes_safe=all(
+                pattern is not None and is_pattern_ascii_only(pattern)
+                for pattern in reader_patterns
+            ),
+            constructs=constructs,
+        )
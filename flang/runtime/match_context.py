@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from typing import Callable
+
+from flang.structures import BaseFlangInputReader, BaseFlangTextInputReader
+from flang.structures.spec import (
+    FlangMatchNumbering,
+    FlangMatchObject,
+    FlangMatchSource,
+    FlangSpanMatchObject,
+)
+from flang.utils.exceptions import MatchNotFoundError
+
+from .compiled_grammar import CompiledGrammar
+from .memo import PackratMemoTable
+
+
+class MatchFailure:
+    """
+    Returned instead of a match object when a construct does not match. Failures
+    are mostly discarded by choice, optional and multi constructs, so they are plain
+    objects, only turned into a `MatchNotFoundError` when matching fails as a whole
+    """
+
+    __slots__ = ("error_type", "construct_id", "position", "message", "cause")
+
+    def __init__(
+        self,
+        error_type: type[MatchNotFoundError],
+        construct_id: int,
+        position: int,
+        message: Callable[[], str] | str | None = None,
+        cause: MatchFailure | None = None,
+    ) -> None:
+        self.error_type = error_type
+        self.construct_id = construct_id
+        self.position = position
+        self.message = message
+        self.cause = cause
+
+    def to_error(self) -> MatchNotFoundError:
+        error = self.error_type(self.construct_id, self.position, self.message)
+
+        if self.cause is not None:
+            error.__cause__ = self.cause.to_error()
+
+        return error
+
+    @classmethod
+    def from_error(cls, error: MatchNotFoundError) -> MatchFailure:
+        return cls(type(error), error.construct_id, error.position, error.message)
+
+
+class MatchContext:
+    """
+    Mutable state of a single match call: memoized results, identifier numbering,
+    sources of compact match objects and the pool matching files. The runtime and
+    its compiled grammar are only read while matching, so concurrent calls, each
+    with its own context, do not need any locking
+    """
+
+    def __init__(
+        self,
+        grammar: CompiledGrammar,
+        memo_size: int | None = None,
+        detailed_failures: bool = False,
+    ) -> None:
+        self.grammar = grammar
+        self.memo = PackratMemoTable(memo_size) if memo_size else None
+        self.numbering = FlangMatchNumbering()
+        self.executor: Executor | None = None
+        self._source: FlangMatchSource | None = None
+        # the failure that got furthest into the input, reported when matching fails
+        self.farthest_position = -1
+        self.farthest_reader: BaseFlangInputReader | None = None
+        self.farthest_construct_ids: list[int] = []
+        self.farthest_file: str | None = None
+        # text at the farthest failure, kept when the reader discards it
+        self.farthest_text: str | None = None
+        # whether failed fused sequences are matched again child by child, to record
+        # the failure of the child that does not match instead of just their start
+        self.detailed_failures = detailed_failures
+        # set when a failure was recorded without the details
+        self.coarse_failures = False
+
+    def get_match_source(self, reader: BaseFlangInputReader) -> FlangMatchSource | None:
+        """Shared source of compact match objects, None if the reader has no text"""
+        if not isinstance(reader, BaseFlangTextInputReader) or reader.source is None:
+            return None
+
+        source = self._source
+
+        if source is None or source.text is not reader.source:
+            source = self._source = self.create_match_source(reader.source)
+
+        return source
+
+    def create_match_source(self, text: str) -> FlangMatchSource:
+        return FlangMatchSource(text, self.grammar.locations, self.numbering)
+
+    def add_match_roots(self, match_objects: list[FlangMatchObject]) -> None:
+        """Registers complete match trees, numbered in the order they are added"""
+        self.numbering.add_roots(match_objects)
+
+        # other objects cannot number the tree when their identifier is read
+        if not all(isinstance(it, FlangSpanMatchObject) for it in match_objects):
+            self.numbering.number()
+
+    def record_failure(self, construct_id: int, reader: BaseFlangInputReader) -> int:
+        """Tracks the farthest failure and returns the position of this one"""
+        position = reader.get_key()
+
+        if position > self.farthest_position:
+            self.farthest_position = position
+            self.farthest_reader = reader
+            self.farthest_construct_ids = [construct_id]
+            self.farthest_text = None
+        elif position == self.farthest_position:
+            self.farthest_construct_ids.append(construct_id)
+
+        return position
+
+    def reset_farthest_failure(self, path: str | None = None) -> None:
+        # positions in different files cannot be compared, only the file being
+        # matched is tracked
+        self.farthest_position = -1
+        self.farthest_reader = None
+        self.farthest_construct_ids = []
+        self.farthest_file = path
+        self.farthest_text = None
+
+    def get_farthest_text(self, size: int = 15) -> str:
+        if self.farthest_text is None:
+            assert self.farthest_reader is not None
+            self.farthest_text = self.farthest_reader.read(size)
+
+        return self.farthest_text
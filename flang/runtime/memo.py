@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Hashable, Union
+
+from flang.structures import FlangMatchObject
+
+if TYPE_CHECKING:
+    from .match_context import MatchFailure
+
+MemoEntry = Union[FlangMatchObject, "MatchFailure"]
+
+
+class PackratMemoTable:
+    """
+    Bounded memo table for packrat parsing. Stores the outcome (match object or
+    `MatchFailure`) of matching a construct at a given reader
+    position. Least recently used entries are evicted once `max_size` is reached
+    """
+
+    def __init__(self, max_size: int = 4096) -> None:
+        assert max_size > 0, "Memo table size must be a positive number"
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, MemoEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> MemoEntry | None:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key: Hashable, entry: MemoEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def reset_stats(self) -> None:
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoStatistics:
+    """
+    Statistics of the memo tables of all match calls of a runtime. Every call uses
+    its own `PackratMemoTable`, whose statistics are added here when the call ends.
+    Calls made by worker processes are not counted
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, memo: PackratMemoTable) -> None:
+        with self._lock:
+            self.calls += 1
+            self.hits += memo.hits
+            self.misses += memo.misses
+            self.evictions += memo.evictions
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "max_size": self.max_size,
+            "calls": self.calls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
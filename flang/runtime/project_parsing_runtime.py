@@ -1,19 +1,30 @@
 import re
+from concurrent.futures import Executor, ProcessPoolExecutor
 from enum import Enum, auto
-
-from flang.structures.input import BaseFlangInputReader, IntermediateFileObject
+from typing import Callable, Iterator, NoReturn
+
+from flang.structures.input import (
+    BaseFlangInputReader,
+    BaseFlangTextInputReader,
+    FileTreeScanner,
+    FlangTextInputReader,
+    IntermediateFileObject,
+)
 from flang.structures.spec import (
     FlangComplexMatchObject,
+    FlangComplexSpanMatchObject,
     FlangDirectoryMatchObject,
     FlangFileMatch,
     FlangFlatFileMatchObject,
+    FlangTextSpanMatchObject,
+    pack_match_objects,
+    unpack_match_objects,
 )
 from flang.utils.common import BUILTIN_PATTERNS
 from flang.utils.exceptions import (
     ComplexMatchNotFound,
     FileMatchNotFound,
     MatchNotFoundError,
-    SkipConstructException,
     SymbolNotFoundError,
     TextMatchNotFound,
     TextNotParsedError,
@@ -26,6 +37,10 @@ from ..structures import (
     FlangMatchObject,
     FlangTextMatchObject,
 )
+from .compiled_grammar import NO_TARGET, ChoiceMode, CompiledGrammar, ConstructKind
+from .match_context import MatchContext, MatchFailure
+from .memo import MemoStatistics
+from .result_store import MatchResultStore
 
 
 class LinkVariant(Enum):
@@ -34,12 +49,40 @@ class LinkVariant(Enum):
 
 
 class ProjectParsingRuntime:
-    def __init__(self, path: str, extra_checks: bool = False) -> None:
+    def __init__(
+        self,
+        path: str,
+        extra_checks: bool = False,
+        memo_size: int | None = None,
+        choice_mode: ChoiceMode | str = ChoiceMode.FIRST,
+        jobs: int = 1,
+        result_store: MatchResultStore | None = None,
+    ) -> None:
         self.path = path
         self.root = ""
         self.symbol_table: dict[str, FlangConstruct] = {}
         self.symbol_occurence_counter: dict[str, int] = {}
         self.extra_checks = extra_checks
+        # used by choices without the "mode" attribute
+        self.choice_mode = ChoiceMode(choice_mode)
+        # number of worker processes matching the files of multi file constructs
+        self.jobs = jobs
+        # results of flat files matched in previous runs
+        self.result_store = result_store
+        # size of the packrat memo table created for every match call
+        self.memo_size = memo_size
+        # statistics of the memo tables of all match calls
+        self.memo_stats = MemoStatistics(memo_size) if memo_size else None
+        self._grammar: CompiledGrammar | None = None
+
+    def enable_memoization(self, max_size: int = 4096) -> MemoStatistics:
+        self.memo_size = max_size
+        self.memo_stats = MemoStatistics(max_size)
+        return self.memo_stats
+
+    def disable_memoization(self) -> None:
+        self.memo_size = None
+        self.memo_stats = None
 
     def find_symbol(self, symbol: str) -> FlangConstruct:
         return self.symbol_table[symbol]
@@ -48,6 +91,26 @@ class ProjectParsingRuntime:
         if symbol in self.symbol_table and not override:
             raise RuntimeError(f"Symbol {symbol} already exists!")
         self.symbol_table[symbol] = constr
+        self._grammar = None
+
+    def compile(self) -> CompiledGrammar:
+        self._grammar = CompiledGrammar.build(
+            self.symbol_table, self.root, self.find_construct_by_path
+        )
+        return self._grammar
+
+    @property
+    def template_hash(self) -> str:
+        return f"{self.grammar.fingerprint}:{self.choice_mode.value}"
+
+    @property
+    def grammar(self) -> CompiledGrammar:
+        grammar = self._grammar
+
+        if grammar is None or grammar.locations[grammar.root] != self.root:
+            return self.compile()
+
+        return grammar
 
     def _get_occurence_value(self, key: str) -> int:
         if key not in self.symbol_occurence_counter:
@@ -57,13 +120,27 @@ class ProjectParsingRuntime:
         self.symbol_occurence_counter[key] += 1
         return self.symbol_occurence_counter[key]
 
-    def _generate_symbol_for_match_object(self, construct_location: str) -> str:
-        occurence_counter_symbol = f"MatchObject({construct_location})"
-        occurence_no = self._get_occurence_value(occurence_counter_symbol)
-        return "{}[{}]".format(construct_location, occurence_no)
+    @staticmethod
+    def _create_text_match_object(
+        context: MatchContext,
+        construct_id: int,
+        reader: BaseFlangTextInputReader,
+        text: str,
+    ) -> FlangTextMatchObject | FlangTextSpanMatchObject:
+        source = context.get_match_source(reader)
+
+        if source is None:
+            # numbered with the whole tree, see `MatchContext.add_match_roots`
+            return FlangTextMatchObject(
+                identifier=context.grammar.locations[construct_id], content=text
+            )
+
+        return FlangTextSpanMatchObject(
+            source, construct_id, reader.cursor, reader.cursor + len(text)
+        )
 
-    def generate_symbol_for_match_object(self, construct: FlangConstruct) -> str:
-        return self._generate_symbol_for_match_object(construct.location)
+    def create_match_context(self, detailed_failures: bool = False) -> MatchContext:
+        return MatchContext(self.grammar, self.memo_size, detailed_failures)
 
     def generate_symbol_for_construct(
         self, element_identifier: str, parent_location: str, allow_duplicates: bool
@@ -130,54 +207,120 @@ class ProjectParsingRuntime:
 
     def _match_on_complex_construct(
         self,
-        construct: FlangConstruct,
+        context: MatchContext,
+        construct_id: int,
         reader: BaseFlangInputReader,
-    ) -> FlangMatchObject:
-        match construct.name:
-            case "sequence":
+    ) -> FlangMatchObject | MatchFailure:
+        grammar = context.grammar
+
+        match grammar.kinds[construct_id]:
+            case ConstructKind.SEQUENCE:
+                if grammar.fused_patterns[construct_id] is not None:
+                    match_object = self._match_fused_sequence(
+                        context, construct_id, reader
+                    )
+
+                    if match_object is not None:
+                        return match_object
+
                 matches = []
+                start_reader = reader
 
-                try:
-                    for child in self.iterate_children(construct.location):
-                        match_objects, reader = self._match_flang_construct(
-                            child, reader, check_if_all_text_parsed=False
+                for child_id in grammar.children[construct_id]:
+                    result = self._match_flang_construct(
+                        context, child_id, reader, check_if_all_text_parsed=False
+                    )
+
+                    if isinstance(result, MatchFailure):
+                        return MatchFailure(
+                            ComplexMatchNotFound,
+                            construct_id,
+                            start_reader.get_key(),
+                            cause=result,
                         )
 
-                        matches += match_objects
-                except MatchNotFoundError as e:
-                    raise ComplexMatchNotFound(
-                        f"Could not match sequence of constructs: {construct.name or construct.location}"
-                    ) from e
+                    match_objects, reader = result
+                    matches += match_objects
+
+                source = context.get_match_source(start_reader)
 
-                return FlangComplexMatchObject(
-                    identifier=self.generate_symbol_for_match_object(construct),
-                    content=matches,
+                if source is None:
+                    return FlangComplexMatchObject(
+                        identifier=grammar.locations[construct_id],
+                        content=matches,
+                        span=(
+                            (start_reader.cursor, reader.cursor)
+                            if isinstance(reader, BaseFlangTextInputReader)
+                            else None
+                        ),
+                    )
+
+                assert isinstance(start_reader, BaseFlangTextInputReader)
+                assert isinstance(reader, BaseFlangTextInputReader)
+
+                return FlangComplexSpanMatchObject(
+                    source, construct_id, start_reader.cursor, reader.cursor, matches
                 )
-            case "choice":
+            case ConstructKind.CHOICE:
+                choice_mode = grammar.choice_modes[construct_id] or self.choice_mode
+                literal_patterns = grammar.literal_choices[construct_id]
+
+                if literal_patterns is not None:
+                    assert isinstance(reader, BaseFlangTextInputReader)
+                    return self._match_literal_choice(
+                        context, construct_id, reader, literal_patterns[choice_mode]
+                    )
+
                 matches = []
                 readers = []
+                next_char = (
+                    reader.peek_char()
+                    if isinstance(reader, BaseFlangTextInputReader)
+                    else None
+                )
 
-                for child in self.iterate_children(construct.location):
-                    try:
-                        match_objects, reader = self._match_flang_construct(
-                            child, reader, check_if_all_text_parsed=False
-                        )
+                for child_id in grammar.children[construct_id]:
+                    if next_char is not None and not grammar.can_start_with(
+                        child_id, next_char
+                    ):
+                        # the alternative would fail on its first character here
+                        context.record_failure(child_id, reader)
+                        continue
+
+                    # every alternative starts from the same (not modified) reader
+                    result = self._match_flang_construct(
+                        context, child_id, reader, check_if_all_text_parsed=False
+                    )
+
+                    if isinstance(result, MatchFailure):
+                        continue
+
+                    match_objects, _ = result
+
+                    # optional alternative that was skipped
+                    if not match_objects:
+                        continue
+
+                    if choice_mode is ChoiceMode.FIRST:
+                        return match_objects[0]
 
-                        matches += match_objects
-                        readers.append(reader)
-                        reader = reader.previous
-                    except MatchNotFoundError:
-                        pass
+                    # only the first match object is returned, so measure just that one
+                    child_reader = reader.copy()
+                    child_reader.consume_data(match_objects[0])
+                    matches.append(match_objects[0])
+                    readers.append(child_reader)
 
                 if not matches:
-                    raise ComplexMatchNotFound(
-                        f"Could not match any construct from: {construct.name or construct.location}"
+                    return MatchFailure(
+                        ComplexMatchNotFound, construct_id, reader.get_key()
                     )
 
+                # on a tie the earlier alternative wins
                 max_reader = max(readers, key=lambda it: it.get_key())
                 return matches[readers.index(max_reader)]
 
-            case "event":
+            case ConstructKind.EVENT:
+                construct = grammar.constructs[construct_id]
                 # name = construct.get_attrib("name", None) or create_unique_symbol(
                 #     "_flang_function"
                 # )
@@ -186,190 +329,818 @@ class ProjectParsingRuntime:
                 body = construct.text
                 # emit_function(name, args, body)
                 raise NotImplementedError
-            case "use":
-                target_location = construct.get_attrib("ref")
-                location = construct.location
+            case ConstructKind.USE:
+                target_id = grammar.use_targets[construct_id]
 
-                try:
-                    target_construct = self.find_construct_by_path(
-                        target_location, location
-                    )
-
-                    attributes = {**construct.attributes, "visible": True}
-                    del attributes["ref"]
-                except SymbolNotFoundError:
+                if target_id == NO_TARGET:
                     raise NotImplementedError(
                         "tutaj w starych wersjach five parsowany zostaje od zera "
                         "plik którego brakuje. To ma działać jezeli formatka jest rozrzucona "
                         "na kilka plikow"
                     )
 
-                return self._match_against_all_construct_variants(
-                    target_construct, reader
-                )
+                return self._match_construct(context, target_id, reader)
             case _:
                 raise UnknownConstructError("Not complex construct")
 
+    @staticmethod
+    def _match_fused_sequence(
+        context: MatchContext, construct_id: int, reader: BaseFlangInputReader
+    ) -> FlangComplexSpanMatchObject | MatchFailure | None:
+        """
+        Matches a sequence of "text" and "regex" constructs with its fused pattern
+        and builds the children from spans of groups. A failure is recorded at the
+        start of the sequence. Returns None when the sequence has to be matched child
+        by child: for readers without the whole text, for regexes matching empty
+        text and on a failure when the context needs the failing child
+        """
+        source = context.get_match_source(reader)
+
+        if source is None:
+            return None
+
+        assert isinstance(reader, BaseFlangTextInputReader)
+        grammar = context.grammar
+        pattern = grammar.fused_patterns[construct_id]
+        matched = pattern and pattern.match(source.text, reader.cursor)
+
+        if not matched:
+            if context.detailed_failures:
+                return None
+
+            context.coarse_failures = True
+            position = context.record_failure(construct_id, reader)
+            return MatchFailure(ComplexMatchNotFound, construct_id, position)
+
+        matches = []
+
+        for child_id, group in zip(
+            grammar.children[construct_id], grammar.fused_groups[construct_id]
+        ):
+            start, end = matched.span(group)
+
+            if start == end:
+                # optional child that was skipped
+                if start < 0:
+                    continue
+                if grammar.kinds[child_id] is ConstructKind.REGEX:
+                    return None
+
+            matches.append(FlangTextSpanMatchObject(source, child_id, start, end))
+
+        return FlangComplexSpanMatchObject(
+            source, construct_id, reader.cursor, matched.end(), matches
+        )
+
+    def _match_literal_choice(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        reader: BaseFlangTextInputReader,
+        pattern: re.Pattern,
+    ) -> FlangTextMatchObject | FlangTextSpanMatchObject | MatchFailure:
+        """
+        Matches a choice of "text" constructs with a single alternation of their
+        literals. The matched literal tells which of the children won
+        """
+        grammar = context.grammar
+        matched_text = reader.match_pattern(pattern)
+
+        if matched_text is None:
+            # the same failures are recorded as when the children are tried one by one
+            for child_id in grammar.children[construct_id]:
+                context.record_failure(child_id, reader)
+
+            return MatchFailure(ComplexMatchNotFound, construct_id, reader.get_key())
+
+        child_id = grammar.literal_choice_ids[construct_id][matched_text]  # type: ignore
+        return self._create_text_match_object(context, child_id, reader, matched_text)
+
     def _match_on_text(
         self,
-        construct: FlangConstruct,
+        context: MatchContext,
+        construct_id: int,
         reader: BaseFlangInputReader,
-    ) -> FlangTextMatchObject:
-        text_to_match = reader.read()
-        construct_text = construct.get_attrib("value", construct.text)
+    ) -> FlangTextMatchObject | MatchFailure:
+        grammar = context.grammar
 
-        match construct.name:
-            case "regex":
-                assert isinstance(text_to_match, str) and isinstance(construct_text, str)
+        match grammar.kinds[construct_id]:
+            case ConstructKind.REGEX:
+                assert isinstance(reader, BaseFlangTextInputReader)
+                pattern = grammar.patterns[construct_id]
 
-                construct_pattern = construct_text.format(**BUILTIN_PATTERNS)
-                matched_text = re.match(construct_pattern, text_to_match)
+                if pattern is None:
+                    pattern = re.compile(self._get_regex_pattern(context, construct_id))
 
-                if not matched_text:
-                    raise TextMatchNotFound(
-                        f'Could not match regex pattern: "{construct_pattern}" with text: "{reader.read()[:15]}"'
+                matched_text = reader.match_pattern(pattern)
+
+                if matched_text is None:
+                    return MatchFailure(
+                        TextMatchNotFound,
+                        construct_id,
+                        context.record_failure(construct_id, reader),
                     )
 
-                if not matched_text.group():
+                if not matched_text:
                     raise RuntimeError(
                         "We have matched an empty object which does not make any sense. Please fix the template to not match such text. Like what would you expect after matching nothing?"
                     )
 
-                return FlangTextMatchObject(
-                    identifier=self.generate_symbol_for_match_object(construct),
-                    content=matched_text.group(),
+                return self._create_text_match_object(
+                    context, construct_id, reader, matched_text
                 )
-            case "text":
-                assert isinstance(text_to_match, str) and isinstance(construct_text, str)
-
-                if not text_to_match.startswith(construct_text):
-                    raise TextMatchNotFound(
-                        f'Could not match text pattern: "{construct_text}" with '
-                        f'text: "{reader.read()[:len(construct_text)]}"'
+            case ConstructKind.TEXT:
+                assert isinstance(reader, BaseFlangTextInputReader)
+                construct_text = grammar.literals[construct_id]
+
+                if construct_text is None:
+                    construct = grammar.constructs[construct_id]
+                    construct_text = construct.get_attrib("value", construct.text)
+                    assert isinstance(construct_text, str)
+
+                if not reader.startswith(construct_text):
+                    return MatchFailure(
+                        TextMatchNotFound,
+                        construct_id,
+                        context.record_failure(construct_id, reader),
                     )
 
-                return FlangTextMatchObject(
-                    identifier=self.generate_symbol_for_match_object(construct),
-                    content=construct_text,
+                return self._create_text_match_object(
+                    context, construct_id, reader, construct_text
                 )
             case _:
                 raise UnknownConstructError("Not text construct")
 
+    @staticmethod
+    def _get_regex_pattern(context: MatchContext, construct_id: int) -> str:
+        pattern = context.grammar.patterns[construct_id]
+
+        if pattern is not None:
+            return pattern.pattern
+
+        construct = context.grammar.constructs[construct_id]
+        construct_text = construct.get_attrib("value", construct.text)
+        assert isinstance(construct_text, str)
+
+        return construct_text.format(**BUILTIN_PATTERNS)
+
     def _match_on_file(
         self,
-        construct: FlangConstruct,
+        context: MatchContext,
+        construct_id: int,
         reader: BaseFlangInputReader,
-    ) -> FlangFileMatch:
-        if construct.name != "file":
+    ) -> FlangFileMatch | MatchFailure:
+        grammar = context.grammar
+        file_pattern = grammar.file_patterns[construct_id]
+
+        if file_pattern is None:
             raise UnknownConstructError("Not file construct")
 
         assert isinstance(reader, FlangFileInputReader)
 
-        current_files = reader.read()
+        pattern, variant = file_pattern
+        matched_file = reader.find_first_file(pattern, variant)
 
-        pattern = construct.get_attrib("pattern")
-        variant = construct.get_attrib("variant", "filename")
+        if not matched_file:
+            return MatchFailure(
+                FileMatchNotFound,
+                construct_id,
+                reader.get_key(),
+                lambda: self._describe_file_failure(pattern, variant, reader),
+            )
 
-        matched_file = IntermediateFileObject.get_first_matched_file(
-            current_files, pattern, variant
-        )
+        store_key = self._get_result_store_key(context, construct_id, matched_file)
+        stored_content = self._load_stored_result(context, store_key)
 
-        if not matched_file:
-            raise FileMatchNotFound(
-                f'Could not match filename pattern: "{pattern}" variant: {variant} with available '
-                f'files in directory: "{[f.path.name for f in current_files]}"'
+        if stored_content is not None:
+            return self._create_file_match_object(
+                context, construct_id, matched_file, stored_content, is_directory=False
             )
 
-        child = next(self.iterate_children(construct.location))
-        sub_reader = matched_file.get_input_reader()
+        child_id = grammar.children[construct_id][0]
+        sub_reader = matched_file.get_input_reader(allow_mmap=grammar.bytes_safe)
+        context.reset_farthest_failure(str(matched_file.path))
 
-        content, _ = self._match_flang_construct(
-            child, sub_reader, check_if_all_text_parsed=True
+        try:
+            result = self._match_flang_construct(
+                context, child_id, sub_reader, check_if_all_text_parsed=True
+            )
+        finally:
+            if context.farthest_reader is not None:
+                # read before the memory map of the file is closed
+                context.get_farthest_text()
+
+            matched_file.release()
+
+        if isinstance(result, MatchFailure):
+            return result
+
+        content, _ = result
+
+        if store_key is not None and self.result_store is not None:
+            self.result_store.store(store_key, pack_match_objects(content))
+
+        return self._create_file_match_object(
+            context,
+            construct_id,
+            matched_file,
+            content,
+            is_directory=isinstance(sub_reader, FlangFileInputReader),
         )
 
-        if isinstance(sub_reader, FlangFileInputReader):
+    def _get_result_store_key(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        matched_file: IntermediateFileObject,
+    ) -> str | None:
+        # only flat files are stored, directories change without their own content
+        if self.result_store is None or matched_file.is_dir:
+            return None
+
+        return self.result_store.get_key(
+            self.template_hash,
+            context.grammar.locations[construct_id],
+            matched_file.get_content_hash(),
+        )
+
+    def _load_stored_result(
+        self, context: MatchContext, store_key: str | None
+    ) -> list[FlangMatchObject] | None:
+        if store_key is None or self.result_store is None:
+            return None
+
+        packed = self.result_store.load(store_key)
+
+        if packed is None:
+            return None
+
+        # objects join the numbering of this match call like newly matched ones
+        text, packed_objects = packed
+        source = None if text is None else context.create_match_source(text)
+        return unpack_match_objects(packed_objects, source)
+
+    @staticmethod
+    def _create_file_match_object(
+        context: MatchContext,
+        construct_id: int,
+        matched_file: IntermediateFileObject,
+        content: list[FlangMatchObject],
+        is_directory: bool,
+    ) -> FlangFileMatch:
+        if is_directory:
             return FlangDirectoryMatchObject(
-                identifier=self.generate_symbol_for_match_object(construct),
+                identifier=context.grammar.locations[construct_id],
                 content=content,  # type: ignore TODO: napraw to
                 filename=matched_file.filename,
             )
 
         return FlangFlatFileMatchObject(
-            identifier=self.generate_symbol_for_match_object(construct),
+            identifier=context.grammar.locations[construct_id],
             content=content,  # type: ignore TODO: napraw to
             filename=matched_file.filename,
         )
 
-    def _match_against_all_construct_variants(
-        self,
-        construct: FlangConstruct,
-        reader: BaseFlangInputReader,
-    ) -> FlangMatchObject:
-        matchers = (
-            self._match_on_complex_construct,
-            self._match_on_text,
-            self._match_on_file,
+    @staticmethod
+    def _describe_file_failure(
+        pattern: str, variant: str, reader: FlangFileInputReader
+    ) -> str:
+        return (
+            f'Could not match filename pattern: "{pattern}" variant: {variant} with '
+            f'available files in directory: "{[f.path.name for f in reader.read()]}"'
         )
-        match_object = None
 
-        for matcher in matchers:
+    def _describe_construct(self, context: MatchContext, construct_id: int) -> str:
+        grammar = context.grammar
+
+        match grammar.names[construct_id]:
+            case "regex":
+                return f'regex "{self._get_regex_pattern(context, construct_id)}"'
+            case "text":
+                construct = grammar.constructs[construct_id]
+                literal = grammar.literals[construct_id]
+
+                if literal is None:
+                    literal = construct.get_attrib("value", construct.text)
+
+                return f'text "{literal}"'
+            case _:
+                return f'"{grammar.locations[construct_id]}"'
+
+    def _describe_farthest_failure(self, context: MatchContext) -> str | None:
+        reader = context.farthest_reader
+
+        if reader is None:
+            return None
+
+        position = context.farthest_position
+        location = f"position {position}"
+
+        if isinstance(reader, BaseFlangTextInputReader) and reader.source is not None:
+            line = reader.source.count("\n", 0, position) + 1
+            column = position - reader.source.rfind("\n", 0, position)
+            location = f"line {line}, column {column}"
+
+        if context.farthest_file is not None:
+            location = f'{location} of "{context.farthest_file}"'
+
+        expected = " or ".join(
+            dict.fromkeys(
+                self._describe_construct(context, construct_id)
+                for construct_id in context.farthest_construct_ids
+            )
+        )
+        found = context.get_farthest_text()
+        return f'Farthest failure at {location}: expected {expected}, found "{found}"'
+
+    def _raise_failure(
+        self,
+        context: MatchContext,
+        error: Exception,
+        match_again: Callable[[MatchContext], object],
+    ) -> NoReturn:
+        """
+        Raises an error that is about to reach the user. Failed fused sequences do
+        not record which of their children failed, so after such failures the input
+        is matched again by `match_again` child by child and its error, with the
+        exact farthest failure, is raised instead
+        """
+        if context.coarse_failures:
+            detailed_context = self.create_match_context(detailed_failures=True)
+            detailed_context.reset_farthest_failure(context.farthest_file)
+
             try:
-                match_object = matcher(construct, reader)
-            except UnknownConstructError:
-                continue
-            else:
-                break
+                match_again(detailed_context)
+            except (MatchNotFoundError, TextNotParsedError) as e:
+                # the first error is not a cause of this one
+                e.__suppress_context__ = True
+                context, error = detailed_context, e
+
+        self._describe_failure(context, error)
+        raise error
+
+    def _describe_failure(self, context: MatchContext, error: Exception) -> None:
+        """Formats the message of an error that is about to reach the user"""
+        farthest_failure = self._describe_farthest_failure(context)
+
+        if isinstance(error, MatchNotFoundError):
+            message = (
+                str(error)
+                if error.message is not None
+                else f'Could not match "{context.grammar.locations[error.construct_id]}" '
+                f"at {error.position}"
+            )
+            error.message = (
+                message if farthest_failure is None else f"{message}. {farthest_failure}"
+            )
+        elif farthest_failure is not None:
+            error.add_note(farthest_failure)
+
+    def _match_files_in_parallel(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        reader: FlangFileInputReader,
+        executor: Executor,
+    ) -> tuple[list[FlangMatchObject], FlangFileInputReader] | MatchFailure:
+        """
+        Same as matching a multi file construct file by file, but the files are
+        matched by worker processes. Results are collected in the order of files in
+        the reader, and matching stops at the first file that does not match
+        """
+        grammar = context.grammar
+        pattern, variant = grammar.file_patterns[construct_id]  # type: ignore
+        child_id = grammar.children[construct_id][0]
+
+        matched_files = reader.find_all_files(pattern, variant)
+
+        if not matched_files:
+            if grammar.optional[construct_id]:
+                return [], reader
+
+            return MatchFailure(
+                FileMatchNotFound,
+                construct_id,
+                reader.get_key(),
+                lambda: self._describe_file_failure(pattern, variant, reader),
+            )
+
+        store_keys = [
+            self._get_result_store_key(context, construct_id, file_object)
+            for file_object in matched_files
+        ]
+        stored_contents = [self._load_stored_result(context, key) for key in store_keys]
+        futures = [
+            (
+                None
+                if stored_content is not None
+                else executor.submit(
+                    _match_file_in_worker,
+                    child_id,
+                    str(file_object.path),
+                    file_object.scanner and file_object.scanner.ignore_patterns,
+                )
+            )
+            for file_object, stored_content in zip(matched_files, stored_contents)
+        ]
+        reader = reader.copy()
+        matches = []
+
+        try:
+            for i, file_object in enumerate(matched_files):
+                if (future := futures[i]) is None:
+                    content, is_directory = stored_contents[i], False
+                else:
+                    try:
+                        content, is_directory = future.result()
+                    except MatchNotFoundError as e:
+                        # errors of worker processes are the only ones left to catch
+                        if matches or grammar.optional[construct_id]:
+                            break
+                        return MatchFailure.from_error(e)
+
+                    store_key = store_keys[i]
+
+                    if store_key is not None and self.result_store is not None:
+                        self.result_store.store(store_key, pack_match_objects(content))
 
-        if match_object is None:
-            raise UnknownConstructError
+                match_object = self._create_file_match_object(
+                    context, construct_id, file_object, content, is_directory
+                )
+                matches.append(match_object)
+                reader.consume_data(match_object)
+        finally:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
 
-        return match_object
+        return matches, reader
+
+    def _match_construct(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        reader: BaseFlangInputReader,
+    ) -> FlangMatchObject | MatchFailure:
+        memo = context.memo
+
+        if memo is None or (reader_key := reader.get_memo_key()) is None:
+            return self._match_construct_uncached(context, construct_id, reader)
+
+        memo_key = (construct_id, reader_key)
+        result = memo.get(memo_key)
+
+        if result is None:
+            result = self._match_construct_uncached(context, construct_id, reader)
+            memo.store(memo_key, result)
+
+        return result
+
+    def _match_construct_uncached(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        reader: BaseFlangInputReader,
+    ) -> FlangMatchObject | MatchFailure:
+        match context.grammar.kinds[construct_id]:
+            case ConstructKind.REGEX | ConstructKind.TEXT:
+                return self._match_on_text(context, construct_id, reader)
+            case ConstructKind.FILE:
+                return self._match_on_file(context, construct_id, reader)
+            case ConstructKind.UNKNOWN:
+                raise UnknownConstructError(context.grammar.names[construct_id])
+            case _:
+                return self._match_on_complex_construct(context, construct_id, reader)
 
     def _match_flang_construct(
         self,
-        construct: FlangConstruct,
+        context: MatchContext,
+        construct_id: int,
         reader: BaseFlangInputReader,
         check_if_all_text_parsed: bool,
-    ) -> tuple[list[FlangMatchObject], BaseFlangInputReader]:
+    ) -> tuple[list[FlangMatchObject], BaseFlangInputReader] | MatchFailure:
+        grammar = context.grammar
+
+        if (
+            context.executor is not None
+            and grammar.multi[construct_id]
+            and grammar.file_patterns[construct_id] is not None
+        ):
+            assert isinstance(reader, FlangFileInputReader)
+            result = self._match_files_in_parallel(
+                context, construct_id, reader, context.executor
+            )
+
+            if isinstance(result, MatchFailure):
+                return result
+
+            matches, reader = result
+
+            if check_if_all_text_parsed and not reader.at_end():
+                raise TextNotParsedError(f"Text left: {reader.read()}")
+
+            return matches, reader
+
+        if grammar.repeat_patterns[construct_id] is not None:
+            result = self._match_repetitions(context, construct_id, reader)
+
+            if isinstance(result, MatchFailure):
+                return result
+
+            if result is not None:
+                matches, reader = result
+
+                if check_if_all_text_parsed and not reader.at_end():
+                    raise TextNotParsedError(f"Text left: {reader.read()}")
+
+                return matches, reader
+
         reader = reader.copy()
         matches = []
+        match_object = self._match_construct(context, construct_id, reader)
 
-        try:
-            match_object = self._match_against_all_construct_variants(construct, reader)
+        if isinstance(match_object, MatchFailure):
+            if not grammar.optional[construct_id]:
+                return match_object
+
+            reader = reader.previous
+        else:
             matches.append(match_object)
             reader.consume_data(match_object)
-        except MatchNotFoundError as e:
-            # TODO: this looks ugly. A lot of additional steps needed if construct is optional
-            if not construct.get_bool_attrib("optional"):
-                raise e
-            else:
-                reader = reader.previous
-        except SkipConstructException:
-            reader = reader.previous
 
-        while construct.get_bool_attrib("multi"):
+        while grammar.multi[construct_id]:
             reader = reader.copy()
-            try:
-                match_object = self._match_against_all_construct_variants(
-                    construct, reader
-                )
-                matches.append(match_object)
-                reader.consume_data(match_object)
-            except MatchNotFoundError as e:
+            match_object = self._match_construct(context, construct_id, reader)
+
+            if isinstance(match_object, MatchFailure):
                 reader = reader.previous
                 break
 
-        if check_if_all_text_parsed and reader.read():
+            matches.append(match_object)
+            reader.consume_data(match_object)
+
+        if check_if_all_text_parsed and not reader.at_end():
             raise TextNotParsedError(f"Text left: {reader.read()}")
 
         return matches, reader
 
-    def match(
-        self, reader: BaseFlangInputReader
+    def _match_repetitions(
+        self,
+        context: MatchContext,
+        construct_id: int,
+        reader: BaseFlangInputReader,
+    ) -> tuple[list[FlangMatchObject], BaseFlangInputReader] | MatchFailure | None:
+        """
+        Matches all repetitions of a multi "text" or "regex" construct in one scan
+        of the text, without the bookkeeping of matching every repetition as a
+        separate construct. Returns None when they have to be matched one by one:
+        for readers without the whole text and for regexes matching empty text
+        """
+        source = context.get_match_source(reader)
+
+        if source is None:
+            return None
+
+        assert isinstance(reader, BaseFlangTextInputReader)
+        grammar = context.grammar
+        pattern = grammar.repeat_patterns[construct_id]
+        text, start = source.text, reader.cursor
+        assert pattern is not None
+        matches: list[FlangMatchObject] = []
+
+        if grammar.kinds[construct_id] is ConstructKind.TEXT:
+            step = len(grammar.literals[construct_id])  # type: ignore
+            end = pattern.match(text, start).end()  # type: ignore
+            matches += (
+                FlangTextSpanMatchObject(source, construct_id, position, position + step)
+                for position in range(start, end, step)
+            )
+        else:
+            position = start
+
+            while (matched := pattern.match(text, position)) is not None:
+                end = matched.end()
+
+                if end == position:
+                    return None
+
+                matches.append(
+                    FlangTextSpanMatchObject(source, construct_id, position, end)
+                )
+                position = end
+
+        if not matches:
+            position = context.record_failure(construct_id, reader)
+
+            if not grammar.optional[construct_id]:
+                return MatchFailure(TextMatchNotFound, construct_id, position)
+
+            return matches, reader
+
+        reader = reader.copy()
+
+        for match_object in matches:
+            reader.consume_data(match_object)
+
+        # the repetition after the last one does not match
+        context.record_failure(construct_id, reader)
+        return matches, reader
+
+    def _match_root(
+        self, context: MatchContext, reader: BaseFlangInputReader
     ) -> tuple[list[FlangMatchObject], BaseFlangInputReader]:
-        return self._match_flang_construct(
-            self.root_construct, reader, check_if_all_text_parsed=True
+        result = self._match_flang_construct(
+            context, context.grammar.root, reader, check_if_all_text_parsed=True
         )
 
+        if isinstance(result, MatchFailure):
+            raise result.to_error()
+
+        context.add_match_roots(result[0])
+        return result
+
+    def match(
+        self, reader: BaseFlangInputReader, context: MatchContext | None = None
+    ) -> tuple[list[FlangMatchObject], BaseFlangInputReader]:
+        """
+        Matches the root construct against the whole input. All state of the call
+        is kept in `context` (a new one by default), so a runtime may be used by
+        many threads at once
+        """
+        if context is None:
+            context = self.create_match_context()
+
+        try:
+            if self.jobs <= 1:
+                return self._match_root(context, reader)
+
+            with ProcessPoolExecutor(
+                max_workers=self.jobs, initializer=_init_file_worker, initargs=(self,)
+            ) as executor:
+                context.executor = executor
+
+                try:
+                    return self._match_root(context, reader)
+                finally:
+                    context.executor = None
+        except (MatchNotFoundError, TextNotParsedError) as e:
+            self._raise_failure(context, e, lambda it: self._match_root(it, reader))
+        finally:
+            self._add_memo_stats(context)
+
+    def _add_memo_stats(self, context: MatchContext) -> None:
+        memo_stats = self.memo_stats
+
+        if memo_stats is not None and context.memo is not None:
+            memo_stats.add(context.memo)
+
+    def iter_match(self, reader: BaseFlangInputReader) -> Iterator[FlangMatchObject]:
+        """
+        Streaming variant of `match` for a root construct with multi="true". Every
+        top-level match object is yielded as soon as it is complete, after which the
+        consumed input and the history of readers are released
+        """
+        context = self.create_match_context()
+        grammar = context.grammar
+        construct_id = grammar.root
+
+        if not grammar.multi[construct_id]:
+            raise RuntimeError(
+                f"Streaming requires the root construct to be multi: {self.root}"
+            )
+
+        try:
+            yield from self._iter_match_objects(context, reader)
+        finally:
+            self._add_memo_stats(context)
+
+    def _iter_match_objects(
+        self, context: MatchContext, reader: BaseFlangInputReader
+    ) -> Iterator[FlangMatchObject]:
+        grammar = context.grammar
+        construct_id = grammar.root
+        matched_any = False
+        start_reader = reader
+
+        def match_again(detailed_context: MatchContext) -> object:
+            return self._match_root(detailed_context, start_reader)
+
+        while True:
+            attempt_reader = reader.copy()
+            match_object = self._match_construct(context, construct_id, attempt_reader)
+
+            if isinstance(match_object, MatchFailure):
+                if not matched_any and not grammar.optional[construct_id]:
+                    self._raise_failure(context, match_object.to_error(), match_again)
+                break
+
+            attempt_reader.consume_data(match_object)
+            context.add_match_roots([match_object])
+            matched_any = True
+            yield match_object
+
+            if context.farthest_reader is not None:
+                # read before the text at the farthest failure is discarded
+                context.get_farthest_text()
+
+            reader = attempt_reader.detach()
+
+            if context.memo is not None:
+                # nothing before the cursor will be matched again
+                context.memo.clear()
+
+        if not reader.at_end():
+            error = TextNotParsedError(f"Text left: {reader.read()}")
+            self._raise_failure(context, error, match_again)
+
+    def can_rematch_in_place(self, match_object: FlangMatchObject) -> bool:
+        """
+        Whether a match object can be matched again on its own, without its parent.
+        Alternatives of a choice cannot: after an edit another alternative may be
+        chosen. Neither can constructs reached only through "use", as they do not
+        have a single known parent
+        """
+        grammar = self.grammar
+        construct_id = grammar.ids.get(match_object.construct_name)
+
+        if construct_id is None:
+            return False
+        if construct_id == grammar.root:
+            return True
+
+        parent_id = grammar.parents[construct_id]
+        return parent_id != NO_TARGET and grammar.names[parent_id] != "choice"
+
+    def rematch(
+        self, match_object: FlangMatchObject, text: str, start: int, length: int
+    ) -> FlangMatchObject | None:
+        """
+        Matches the construct that produced `match_object` again at offset `start` of
+        the edited `text`. Returns None when it cannot be rematched in place or when
+        the new match does not span exactly `length` characters
+        """
+        if not self.can_rematch_in_place(match_object):
+            return None
+
+        context = self.create_match_context()
+        construct_id = context.grammar.ids[match_object.construct_name]
+
+        reader = FlangTextInputReader(text, cursor=start)
+
+        new_match_object = self._match_construct(context, construct_id, reader)
+
+        if isinstance(new_match_object, MatchFailure):
+            return None
+
+        if len(new_match_object) != length:
+            return None
+
+        return new_match_object
+
     def get_construct_from_spec(self, match_object: FlangMatchObject) -> FlangConstruct:
         return self.find_symbol(match_object.construct_name)
+
+
+# state of a worker process matching files for `ProjectParsingRuntime.jobs` > 1
+_worker_runtime: ProjectParsingRuntime | None = None
+
+
+def _init_file_worker(runtime: ProjectParsingRuntime) -> None:
+    global _worker_runtime
+
+    runtime.jobs = 1
+    _worker_runtime = runtime
+
+
+def _match_file_in_worker(
+    construct_id: int, path: str, ignore_patterns: tuple[str, ...] | None
+) -> tuple[list[FlangMatchObject], bool]:
+    runtime = _worker_runtime
+    assert runtime is not None, "Worker process was not initialized"
+
+    scanner = FileTreeScanner(ignore_patterns) if ignore_patterns is not None else None
+    file_object = IntermediateFileObject(path, scanner=scanner)
+    # objects are returned without numbers, the main process numbers them together
+    # with the rest of the tree, so identifiers do not depend on task scheduling
+    context = runtime.create_match_context()
+    sub_reader = file_object.get_input_reader(allow_mmap=context.grammar.bytes_safe)
+    context.reset_farthest_failure(path)
+
+    def match(context: MatchContext) -> tuple[list[FlangMatchObject], bool]:
+        result = runtime._match_flang_construct(
+            context, construct_id, sub_reader, check_if_all_text_parsed=True
+        )
+
+        if isinstance(result, MatchFailure):
+            raise result.to_error()
+
+        content, _ = result
+        return content, isinstance(sub_reader, FlangFileInputReader)
+
+    try:
+        return match(context)
+    except (MatchNotFoundError, TextNotParsedError) as e:
+        # the error is sent back to the main process with its message
+        runtime._raise_failure(context, e, match)
+    finally:
+        file_object.release()
@@ -0,0 +1,151 @@
+import hashlib
+import pathlib
+import pickle
+import sqlite3
+import threading
+import time
+
+from flang.structures.spec import PackedMatchObjects
+from flang.utils.common import get_cache_root, get_engine_fingerprint
+
+
+class MatchResultStore:
+    """
+    Persistent store of match results of single files, kept in an SQLite database.
+    Results are stored packed (see `pack_match_objects`) and keyed by the engine,
+    the compiled template, the location of the file construct and the hash of the
+    file content, so unchanged files are not parsed again.
+    Least recently used entries are evicted when the store grows over `max_bytes`.
+    Every thread uses its own connection, so one store can serve concurrent matches
+    """
+
+    def __init__(
+        self, path: str | pathlib.Path | None = None, max_bytes: int = 256 * 1024 * 1024
+    ) -> None:
+        self.path = pathlib.Path(path) if path else get_cache_root() / "results.sqlite"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict:
+        # connections cannot be shared between processes, they are opened on demand
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = self._local.connection = sqlite3.connect(self.path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            connection.commit()
+
+        return connection
+
+    @staticmethod
+    def get_key(template_hash: str, location: str, content_hash: str) -> str:
+        return hashlib.sha256(
+            "\0".join(
+                [get_engine_fingerprint(), template_hash, location, content_hash]
+            ).encode()
+        ).hexdigest()
+
+    def load(self, key: str) -> PackedMatchObjects | None:
+        row = self.connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        try:
+            content = pickle.loads(row[0])
+        except Exception:
+            # corrupted entry, matching the file again will replace it
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self.connection:
+            self.connection.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+
+        return content
+
+    def store(self, key: str, content: PackedMatchObjects) -> None:
+        value = pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+
+        self._evict()
+
+    def _evict(self) -> None:
+        (total_size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+        if total_size <= self.max_bytes:
+            return
+
+        rows = self.connection.execute(
+            "SELECT key, size FROM results ORDER BY accessed ASC"
+        ).fetchall()
+        evicted_keys = []
+
+        for key, size in rows:
+            if total_size <= self.max_bytes:
+                break
+
+            evicted_keys.append((key,))
+            total_size -= size
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM results WHERE key = ?", evicted_keys)
+
+        self.evictions += len(evicted_keys)
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def stats(self) -> dict[str, int]:
+        entries, total_size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+        return {
+            "entries": entries,
+            "size": total_size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -3,11 +3,21 @@ from .spec import *
 
 __all__ = [
     "BaseFlangInputReader",
+    "BaseFlangTextInputReader",
     "FlangTextInputReader",
+    "FlangMmapInputReader",
+    "FlangStreamInputReader",
     "FlangFileInputReader",
+    "FlangFileIndex",
     "IntermediateFileObject",
+    "FileTreeScanner",
     "FlangFileMatchObject",
+    "FlangDirectoryMatchObject",
     "FlangTextMatchObject",
+    "FlangMatchSource",
+    "FlangMatchNumbering",
+    "FlangTextSpanMatchObject",
+    "FlangComplexSpanMatchObject",
     "FlangMatchObject",
     "FlangConstruct",
 ]
@@ -2,65 +2,207 @@ from __future__ import annotations
 
 import abc
 import fnmatch
+import functools
+import hashlib
 import io
+import mmap
+import os
 import pathlib
 import re
+from typing import Hashable, Iterable
+
+from flang.utils.common import convert_to_bool
+
+from .spec import (
+    FlangDirectoryMatchObject,
+    FlangFlatFileMatchObject,
+    FlangTextMatchObject,
+)
+
+
+class FileTreeScanner:
+    """
+    Per-run cache of the scanned file tree. Every directory is listed at most once
+    with `os.scandir`, and the `stat` results of its entries are kept. Entries with
+    names matching one of `ignore_patterns` (glob) are pruned and never visited
+    """
+
+    def __init__(self, ignore_patterns: Iterable[str] = ()) -> None:
+        self.ignore_patterns = tuple(ignore_patterns)
+        self._ignored_names = (
+            re.compile("|".join(map(fnmatch.translate, self.ignore_patterns)))
+            if self.ignore_patterns
+            else None
+        )
+        self._listings: dict[str, list[IntermediateFileObject]] = {}
+        self._stats: dict[str, os.stat_result] = {}
+
+    def is_ignored(self, name: str) -> bool:
+        return self._ignored_names is not None and bool(self._ignored_names.match(name))
+
+    def list_directory(
+        self, path: str, mmap_threshold: int | None = None
+    ) -> list[IntermediateFileObject]:
+        if (listing := self._listings.get(path)) is not None:
+            return listing
+
+        listing = []
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if self.is_ignored(entry.name):
+                    continue
+
+                try:
+                    self._stats[entry.path] = entry.stat()
+                    is_dir = entry.is_dir()
+                except OSError:
+                    # broken symlinks and entries removed while scanning
+                    continue
 
-from .spec import FlangTextMatchObject
+                listing.append(
+                    IntermediateFileObject(
+                        entry.path,
+                        mmap_threshold=mmap_threshold,
+                        scanner=self,
+                        is_dir=is_dir,
+                    )
+                )
+
+        self._listings[path] = listing
+        return listing
+
+    def stat(self, path: str) -> os.stat_result:
+        if (stat_result := self._stats.get(path)) is None:
+            stat_result = self._stats[path] = os.stat(path)
+
+        return stat_result
 
 
 class IntermediateFileObject:
-    def __init__(self, path: str, content: list | None = None) -> None:
+    # files of at least this many bytes are matched through a memory-mapped reader
+    # instead of being read into a `str`. `None` disables memory mapping
+    mmap_threshold: int | None = 64 * 1024 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        content: list | None = None,
+        mmap_threshold: int | None = None,
+        scanner: FileTreeScanner | None = None,
+        is_dir: bool | None = None,
+    ) -> None:
         self.path = pathlib.Path(path)
         self._content = content
+        self._text: str | None = None
+        self._mmap: mmap.mmap | None = None
+        self._is_dir = is_dir
+        self.scanner = scanner
+
+        if mmap_threshold is not None:
+            self.mmap_threshold = mmap_threshold
+
+        # objects created by the scanner come from an existing directory entry
+        if is_dir is None:
+            assert self.path.exists()
+
+    @property
+    def is_dir(self) -> bool:
+        if self._is_dir is None:
+            self._is_dir = self.path.is_dir()
 
-        assert self.path.exists()
+        return self._is_dir
 
     @property
     def content(self) -> str | list[IntermediateFileObject]:
         if self._content is not None:
             return self._content
 
-        if self.path.is_dir():
-            return [IntermediateFileObject(str(file)) for file in self.path.iterdir()]
-        else:
+        if self.is_dir:
+            if self.scanner is not None:
+                return self.scanner.list_directory(str(self.path), self.mmap_threshold)
+
+            return [
+                IntermediateFileObject(str(file), mmap_threshold=self.mmap_threshold)
+                for file in self.path.iterdir()
+            ]
+
+        if self._text is None:
             with open(self.path) as f:
-                return f.read()
+                self._text = f.read()
+
+        return self._text
+
+    def get_content_hash(self) -> str:
+        with open(self.path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    def release(self) -> None:
+        """
+        Drops the file content loaded by `content`, it is read again on next access,
+        and closes the memory map of the reader
+        """
+        self._text = None
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def should_use_mmap(self) -> bool:
+        if self.mmap_threshold is None or self._content is not None:
+            return False
+
+        if self.scanner is not None:
+            size = self.scanner.stat(str(self.path)).st_size
+        else:
+            size = self.path.stat().st_size
+
+        # empty files cannot be mapped
+        return size >= max(self.mmap_threshold, 1)
 
     @property
     def filename(self) -> str:
         return self.path.name
 
-    def get_input_reader(self) -> FlangFileInputReader | FlangTextInputReader:
-        if self.path.is_dir():
-            assert isinstance(self.content, list)
-            return FlangFileInputReader(self.content, filename=self.path.name)
-
-        assert isinstance(self.content, str)
-        return FlangTextInputReader(self.content)
+    def get_input_reader(
+        self, allow_mmap: bool = True
+    ) -> FlangFileInputReader | BaseFlangTextInputReader:
+        """
+        `allow_mmap` is False when some pattern of the template cannot run on the
+        bytes of the file, see `FlangMmapInputReader`
+        """
+        if self.is_dir:
+            content = self.content
+            assert isinstance(content, list)
+            return FlangFileInputReader(content, filename=self.path.name)
+
+        if allow_mmap and self.should_use_mmap():
+            reader = FlangMmapInputReader.from_path(str(self.path))
+            self._mmap = reader.data
+            return reader
+
+        content = self.content
+        assert isinstance(content, str)
+        return FlangTextInputReader(content)
 
     @staticmethod
     def get_first_matched_file(
         list_of_files: list[IntermediateFileObject], pattern: str, variant: str
     ) -> IntermediateFileObject | None:
-        assert variant in ("filename", "glob", "regex")
-
-        if variant == "glob":
-            pattern = fnmatch.translate(pattern)
+        matcher = compile_file_pattern(pattern, variant)
 
         def _is_pathname_matched(file_object):
-            if variant == "filename":
+            if matcher is None:
                 return file_object.path.name == pattern
 
-            return re.match(pattern, file_object.path.name)
+            return matcher.match(file_object.path.name)
 
-        try:
-            return next(filter(_is_pathname_matched, list_of_files))
-        except StopIteration:
-            return None
+        return next(filter(_is_pathname_matched, list_of_files), None)
 
 
-sanity_check = True
+# debug mode: readers verify that consumed match objects agree with the input,
+# which reads the matched text again. Enabled with FIVE_DEBUG=1
+sanity_check = convert_to_bool(os.environ.get("FIVE_DEBUG", "false"))
 
 
 class BaseFlangInputReader(abc.ABC):
@@ -68,8 +210,13 @@ class BaseFlangInputReader(abc.ABC):
     def read(self):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def at_end(self) -> bool:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_key(self) -> int:
+        """Amount of consumed input, used to compare readers after matching"""
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -85,79 +232,462 @@ class BaseFlangInputReader(abc.ABC):
     def previous(self) -> BaseFlangInputReader:
         raise NotImplementedError
 
+    def get_memo_key(self) -> Hashable | None:
+        # readers returning None are never memoized by the packrat table
+        return None
+
+    def detach(self) -> BaseFlangInputReader:
+        """Returns a copy of the reader without the chain of previous readers"""
+        reader = self.copy()
+        reader._previous = None  # type: ignore
+        return reader
+
+
+class BaseFlangTextInputReader(BaseFlangInputReader):
+    @property
+    @abc.abstractmethod
+    def cursor(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def match_pattern(self, pattern: re.Pattern) -> str | None:
+        """Returns text matched by the pattern at the cursor position"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def startswith(self, literal: str) -> bool:
+        raise NotImplementedError
+
+    def peek_char(self) -> str:
+        """Returns the character at the cursor or an empty string at the end of input"""
+        return self.read(1)
+
+    @property
+    def source(self) -> str | None:
+        """
+        Whole input text with `cursor` as an offset into it. Compact match objects
+        are only created by readers that keep such text
+        """
+        return None
+
+
+class FlangTextInputReader(BaseFlangTextInputReader):
+    """
+    Keeps the whole source text and an integer offset into it. Matching is done in
+    place (`pattern.match(text, pos)`, `text.startswith(literal, pos)`), so copying
+    a reader or trying a construct never copies the remaining input
+    """
 
-class FlangTextInputReader(BaseFlangInputReader):
     def __init__(
         self,
         data: str | io.StringIO,
         cursor: int | None = None,
         previous: FlangTextInputReader | None = None,
     ) -> None:
-        self._data = io.StringIO(data) if isinstance(data, str) else data
+        self._data = data.getvalue() if isinstance(data, io.StringIO) else data
         self._cursor = cursor or 0
         self._previous = previous
 
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    @property
+    def source(self) -> str:
+        return self._data
+
     def read(self, size=None) -> str:
-        self._data.seek(self._cursor)  # look-up correct scope of input stream
-        data = self._data.read() if size is None else self._data.read(size)
-        self._data.seek(self._cursor)  # return to the initial state
-        return data
+        end = None if size is None else self._cursor + size
+        return self._data[self._cursor : end]
 
-    def get_key(self):
-        import warnings
+    def at_end(self) -> bool:
+        return self._cursor >= len(self._data)
 
-        warnings.warn("NOT IMPLEMENTED!")
-        return 0
+    def match_pattern(self, pattern: re.Pattern) -> str | None:
+        matched = pattern.match(self._data, self._cursor)
+        return None if matched is None else matched.group()
+
+    def startswith(self, literal: str) -> bool:
+        return self._data.startswith(literal, self._cursor)
+
+    def get_key(self) -> int:
+        return self._cursor
 
     def consume_data(self, data: FlangTextMatchObject) -> None:
         if sanity_check:
-            consumed_data = self.read(len(data))
-            assert consumed_data == data.get_raw_content()
+            assert self.startswith(data.get_raw_content())
         self._cursor += len(data)
 
     def copy(self) -> FlangTextInputReader:
         return FlangTextInputReader(self._data, cursor=self._cursor, previous=self)
 
+    def get_memo_key(self) -> Hashable:
+        return (self._data, self._cursor)
+
     @property
     def previous(self) -> FlangTextInputReader:
         assert self._previous is not None
         return self._previous
 
 
+class _StreamBuffer:
+    """
+    Window of a text stream shared by all readers created from the same stream.
+    `offset` is the absolute position of the first buffered character
+    """
+
+    def __init__(self, stream: io.TextIOBase, chunk_size: int) -> None:
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.offset = 0
+        self.eof = False
+
+    @property
+    def end(self) -> int:
+        return self.offset + len(self.text)
+
+    def fill(self, position: int | None = None) -> None:
+        chunks = []
+        available = self.end
+
+        while (position is None or available < position) and not self.eof:
+            chunk = self.stream.read(self.chunk_size)
+
+            if not chunk:
+                self.eof = True
+                break
+
+            chunks.append(chunk)
+            available += len(chunk)
+
+        if chunks:
+            self.text += "".join(chunks)
+
+    def discard(self, position: int) -> None:
+        if position > self.offset:
+            self.text = self.text[position - self.offset :]
+            self.offset = position
+
+
+class FlangStreamInputReader(BaseFlangTextInputReader):
+    """
+    Text reader pulling data from a stream in chunks. At least `lookahead` characters
+    after the cursor are buffered before each match attempt (more when a match
+    reaches the end of the buffer), so a construct must be decidable within that
+    window. Text before the cursor is dropped when the reader is detached
+    """
+
+    def __init__(
+        self,
+        data: io.TextIOBase | _StreamBuffer,
+        cursor: int | None = None,
+        previous: FlangStreamInputReader | None = None,
+        chunk_size: int = 64 * 1024,
+        lookahead: int = 64 * 1024,
+    ) -> None:
+        self._buffer = (
+            data if isinstance(data, _StreamBuffer) else _StreamBuffer(data, chunk_size)
+        )
+        self._cursor = cursor or 0
+        self._previous = previous
+        self.lookahead = lookahead
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def _local_cursor(self) -> int:
+        assert self._cursor >= self._buffer.offset, "Reading already discarded data"
+        return self._cursor - self._buffer.offset
+
+    def read(self, size=None) -> str:
+        self._buffer.fill(None if size is None else self._cursor + size)
+        start = self._local_cursor()
+        end = None if size is None else start + size
+        return self._buffer.text[start:end]
+
+    def at_end(self) -> bool:
+        self._buffer.fill(self._cursor + 1)
+        return self._cursor >= self._buffer.end
+
+    def match_pattern(self, pattern: re.Pattern) -> str | None:
+        lookahead = self.lookahead
+
+        while True:
+            self._buffer.fill(self._cursor + lookahead)
+            text = self._buffer.text
+            matched = pattern.match(text, self._local_cursor())
+
+            # the match could continue past the buffered text, so read more and retry
+            if matched is None or matched.end() < len(text) or self._buffer.eof:
+                return None if matched is None else matched.group()
+
+            lookahead *= 2
+
+    def startswith(self, literal: str) -> bool:
+        self._buffer.fill(self._cursor + len(literal))
+        return self._buffer.text.startswith(literal, self._local_cursor())
+
+    def get_key(self) -> int:
+        return self._cursor
+
+    def consume_data(self, data: FlangTextMatchObject) -> None:
+        if sanity_check:
+            assert self.startswith(data.get_raw_content())
+        self._cursor += len(data)
+
+    def copy(self) -> FlangStreamInputReader:
+        return FlangStreamInputReader(
+            self._buffer, cursor=self._cursor, previous=self, lookahead=self.lookahead
+        )
+
+    def get_memo_key(self) -> Hashable:
+        return (self._buffer, self._cursor)
+
+    def detach(self) -> FlangStreamInputReader:
+        self._buffer.discard(self._cursor)
+        return FlangStreamInputReader(
+            self._buffer, cursor=self._cursor, lookahead=self.lookahead
+        )
+
+    @property
+    def previous(self) -> FlangStreamInputReader:
+        assert self._previous is not None
+        return self._previous
+
+
+@functools.lru_cache(maxsize=None)
+def _get_bytes_pattern(pattern: re.Pattern, encoding: str) -> re.Pattern[bytes]:
+    if isinstance(pattern.pattern, bytes):
+        return pattern
+
+    return re.compile(pattern.pattern.encode(encoding), pattern.flags & ~re.UNICODE)
+
+
+@functools.lru_cache(maxsize=4096)
+def _encode_literal(literal: str, encoding: str) -> bytes:
+    return literal.encode(encoding)
+
+
+class FlangMmapInputReader(BaseFlangTextInputReader):
+    """
+    Text reader over a memory-mapped file. Patterns are converted to byte patterns
+    and run directly on the mapped buffer, so the file is never loaded into a `str`.
+    The cursor is a byte offset. Only patterns matching ASCII characters may be
+    used, others could match a part of a multi-byte character (and note that byte
+    patterns treat classes like `\\w` as ASCII-only)
+    """
+
+    def __init__(
+        self,
+        data: mmap.mmap,
+        cursor: int | None = None,
+        previous: FlangMmapInputReader | None = None,
+        encoding: str = "utf-8",
+    ) -> None:
+        self._data = data
+        self._cursor = cursor or 0
+        self._previous = previous
+        self.encoding = encoding
+
+    @classmethod
+    def from_path(cls, path: str, encoding: str = "utf-8") -> FlangMmapInputReader:
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls(data, encoding=encoding)
+
+    @property
+    def data(self) -> mmap.mmap:
+        return self._data
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def read(self, size=None) -> str:
+        end = len(self._data) if size is None else self._cursor + size
+        return self._data[self._cursor : end].decode(self.encoding, errors="replace")
+
+    def at_end(self) -> bool:
+        return self._cursor >= len(self._data)
+
+    def match_pattern(self, pattern: re.Pattern) -> str | None:
+        bytes_pattern = _get_bytes_pattern(pattern, self.encoding)
+        matched = bytes_pattern.match(self._data, self._cursor)  # type: ignore
+        return None if matched is None else matched.group().decode(self.encoding)
+
+    def startswith(self, literal: str) -> bool:
+        encoded = _encode_literal(literal, self.encoding)
+        return self._data[self._cursor : self._cursor + len(encoded)] == encoded
+
+    def peek_char(self) -> str:
+        # a single character takes up to 4 bytes in utf-8
+        data = self._data[self._cursor : self._cursor + 4]
+        return data.decode(self.encoding, errors="ignore")[:1]
+
+    def get_key(self) -> int:
+        return self._cursor
+
+    def consume_data(self, data: FlangTextMatchObject) -> None:
+        if sanity_check:
+            assert self.startswith(data.get_raw_content())
+
+        if data.span is not None:
+            start, end = data.span
+            self._cursor += end - start
+        else:
+            self._cursor += len(_encode_literal(data.get_raw_content(), self.encoding))
+
+    def copy(self) -> FlangMmapInputReader:
+        return FlangMmapInputReader(
+            self._data, cursor=self._cursor, previous=self, encoding=self.encoding
+        )
+
+    def get_memo_key(self) -> Hashable:
+        return (self._data, self._cursor)
+
+    @property
+    def previous(self) -> FlangMmapInputReader:
+        assert self._previous is not None
+        return self._previous
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_file_pattern(pattern: str, variant: str) -> re.Pattern | None:
+    """Returns compiled matcher of a file construct, `None` for exact filenames"""
+    assert variant in ("filename", "glob", "regex")
+
+    if variant == "filename":
+        return None
+    if variant == "glob":
+        pattern = fnmatch.translate(pattern)
+
+    return re.compile(pattern)
+
+
+class FlangFileIndex:
+    """
+    Index of files in one directory shared by all readers created from it. Exact
+    filenames are resolved with a dict lookup and positions of files matching a
+    glob or regex pattern are computed once per pattern
+    """
+
+    def __init__(self, files: list[IntermediateFileObject]) -> None:
+        self.files = files
+        self.positions = {file_object.filename: i for i, file_object in enumerate(files)}
+        self._matching_positions: dict[tuple[str, str], tuple[int, ...]] = {}
+
+    def find_matching_positions(self, pattern: str, variant: str) -> tuple[int, ...]:
+        key = (pattern, variant)
+
+        if (positions := self._matching_positions.get(key)) is not None:
+            return positions
+
+        matcher = compile_file_pattern(pattern, variant)
+
+        if matcher is None:
+            position = self.positions.get(pattern)
+            positions = () if position is None else (position,)
+        else:
+            positions = tuple(
+                i
+                for i, file_object in enumerate(self.files)
+                if matcher.match(file_object.filename)
+            )
+
+        self._matching_positions[key] = positions
+        return positions
+
+
 class FlangFileInputReader(BaseFlangInputReader):
+    """
+    Reader over files of a directory. Consumed files are stored as a bit mask of
+    their positions, so copying a reader is O(1). For every pattern the reader
+    remembers how many of its matching files are already consumed, files are only
+    consumed, so lookups continue from there instead of scanning from the start
+    """
+
     def __init__(
         self,
-        data: list[IntermediateFileObject],
+        data: list[IntermediateFileObject] | FlangFileIndex,
         filename: str,
-        cursor: list | None = None,
+        consumed: int = 0,
         previous: FlangFileInputReader | None = None,
+        next_matches: dict[tuple[str, str], int] | None = None,
     ) -> None:
-        self._data = data
-        self._cursor = list(range(len(data))) if cursor is None else cursor.copy()
+        self._index = data if isinstance(data, FlangFileIndex) else FlangFileIndex(data)
+        self._data = self._index.files
+        self._consumed = consumed
         self._previous = previous
+        # first possibly unconsumed one of the positions matching a pattern
+        self._next_matches = {} if next_matches is None else next_matches
         self.filename = filename
 
     def read(self) -> list[IntermediateFileObject]:
-        return [self._data[i] for i in self._cursor]
+        """Remaining (not consumed) files"""
+        return [
+            file_object
+            for i, file_object in enumerate(self._data)
+            if not self._consumed >> i & 1
+        ]
+
+    def find_first_file(
+        self, pattern: str, variant: str
+    ) -> IntermediateFileObject | None:
+        key = (pattern, variant)
+        positions = self._index.find_matching_positions(pattern, variant)
+        next_match = self._next_matches.get(key, 0)
+
+        while next_match < len(positions):
+            i = positions[next_match]
+
+            if not self._consumed >> i & 1:
+                self._next_matches[key] = next_match
+                return self._data[i]
+
+            next_match += 1
+
+        self._next_matches[key] = next_match
+        return None
 
-    def get_key(self):
-        import warnings
+    def find_all_files(self, pattern: str, variant: str) -> list[IntermediateFileObject]:
+        return [
+            self._data[i]
+            for i in self._index.find_matching_positions(pattern, variant)
+            if not self._consumed >> i & 1
+        ]
 
-        warnings.warn("NOT IMPLEMENTED!")
-        return 0
+    def at_end(self) -> bool:
+        return self._consumed.bit_count() == len(self._data)
 
-    def consume_data(self, data: FlangFileInputReader) -> None:
-        filenames = [f.path.name for f in self._data]
-        self._cursor.remove(filenames.index(data.filename))
+    def get_key(self) -> int:
+        # number of files already consumed
+        return self._consumed.bit_count()
+
+    def consume_data(
+        self, data: FlangFlatFileMatchObject | FlangDirectoryMatchObject
+    ) -> None:
+        position = self._index.positions[data.filename]
 
         if sanity_check:
-            assert len(self._cursor) == len(set(self._cursor))
+            assert not self._consumed >> position & 1, "File consumed twice"
+
+        self._consumed |= 1 << position
 
     def copy(self) -> FlangFileInputReader:
         return FlangFileInputReader(
-            self._data, filename=self.filename, cursor=self._cursor.copy(), previous=self
+            self._index,
+            filename=self.filename,
+            consumed=self._consumed,
+            previous=self,
+            next_matches=dict(self._next_matches),
         )
 
+    def get_memo_key(self) -> Hashable:
+        return (self._index, self._consumed)
+
     @property
     def previous(self) -> FlangFileInputReader:
         assert self._previous is not None
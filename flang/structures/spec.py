@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import copy
 import dataclasses
+import operator
 import pathlib
 import re
 
@@ -14,6 +16,9 @@ class FlangConstruct:
     children: list[str]
     text: str | None
     location: str
+    # filled at template load time for "regex" and "text" constructs
+    pattern: re.Pattern | None = None
+    literal: str | None = None
 
     def get_attrib(self, key: str, default=None):
         return self.attributes.get(key, default)
@@ -28,6 +33,9 @@ class FlangConstruct:
 
 @dataclasses.dataclass
 class FlangMatchObject:
+    # empty slots let the compact subclasses below go without an instance __dict__
+    __slots__ = ()
+
     identifier: ...
     content: ...
 
@@ -51,6 +59,12 @@ class FlangMatchObject:
     def __len__(self):
         raise NotImplementedError
 
+    def replace_content(
+        self, content: list[FlangMatchObject], length_delta: int
+    ) -> FlangMatchObject:
+        """Copy of the object with new children, spanning `length_delta` more text"""
+        return dataclasses.replace(self, content=content)  # type: ignore
+
     def to_representation(self):
         if isinstance(self.content, list):
             return (
@@ -73,9 +87,12 @@ class FlangDirectoryMatchObject(FlangMatchObject):
     identifier: str
     content: list[FlangFlatFileMatchObject]
     filename: str
+    _length: int = dataclasses.field(default=-1, init=False, repr=False, compare=False)
 
     def __len__(self) -> int:
-        return sum(map(len, self.content))
+        if self._length < 0:
+            self._length = sum(map(len, self.content))
+        return self._length
 
     def get_raw_content(self) -> str | list[str]:
         assert pathlib.Path(self.filename).is_dir()
@@ -86,6 +103,10 @@ class FlangDirectoryMatchObject(FlangMatchObject):
 class FlangTextMatchObject(FlangMatchObject):
     identifier: str
     content: str
+    # (start, end) cursor positions of readers that do not count text in characters
+    span: tuple[int, int] | None = dataclasses.field(
+        default=None, kw_only=True, repr=False, compare=False
+    )
 
     def __len__(self) -> int:
         return len(self.content)
@@ -98,19 +119,176 @@ class FlangTextMatchObject(FlangMatchObject):
 class FlangComplexMatchObject(FlangMatchObject):
     identifier: str
     content: list[FlangTextMatchObject | FlangComplexMatchObject]
+    span: tuple[int, int] | None = dataclasses.field(
+        default=None, kw_only=True, repr=False, compare=False
+    )
+    # computed on first use, children are not modified after matching
+    _length: int = dataclasses.field(default=-1, init=False, repr=False, compare=False)
 
     def __len__(self) -> int:
-        return sum(map(len, self.content))
+        if self._length < 0:
+            self._length = sum(map(len, self.content))
+        return self._length
 
     def get_raw_content(self) -> str:
         return "".join(it.get_raw_content() for it in self.content)
 
+    def replace_content(
+        self, content: list[FlangMatchObject], length_delta: int
+    ) -> FlangComplexMatchObject:
+        # the cached length is not copied, it is computed again from the new children
+        span = self.span and (self.span[0], self.span[1] + length_delta)
+        return dataclasses.replace(self, content=content, span=span)  # type: ignore
+
 
 @dataclasses.dataclass
 class FlangFlatFileMatchObject(FlangComplexMatchObject):
     filename: str
 
 
+# next occurence number of every construct location
+OccurenceCounters = dict[str, int]
+
+
+def get_next_occurence(counters: OccurenceCounters, location: str) -> int:
+    occurence = counters.get(location, 0)
+    counters[location] = occurence + 1
+    return occurence
+
+
+class FlangMatchNumbering:
+    """
+    Numbers identifiers of the match trees of a single match call. Trees are
+    numbered in document order, all at once, the first time an identifier of a
+    compact match object is read, so identifiers do not depend on the order in
+    which they are read
+    """
+
+    __slots__ = ("counters", "roots")
+
+    def __init__(self) -> None:
+        self.counters: OccurenceCounters = {}
+        self.roots: list[FlangMatchObject] = []
+
+    def add_roots(self, match_objects: list[FlangMatchObject]) -> None:
+        self.roots += match_objects
+
+    def number(self) -> None:
+        roots, self.roots = self.roots, []
+
+        for match_object in roots:
+            number_match_tree(match_object, self.counters)
+
+
+class FlangMatchSource:
+    """
+    Source text matched in a single match call, the construct locations of the
+    grammar and the numbering of that call, shared by all compact match objects
+    created from it
+    """
+
+    __slots__ = ("text", "locations", "numbering")
+
+    def __init__(
+        self, text: str, locations: tuple[str, ...], numbering: FlangMatchNumbering
+    ) -> None:
+        self.text = text
+        self.locations = locations
+        self.numbering = numbering
+
+
+class FlangSpanMatchObject(FlangMatchObject):
+    """
+    Compact match object: an integer construct id and (start, end) offsets into the
+    shared source. The matched text is only built when it is read, and so is the
+    identifier, which is numbered with the rest of the matched trees when the
+    first identifier is read
+    """
+
+    __slots__ = ("source", "construct_id", "start", "end", "_occurence")
+
+    def __init__(
+        self, source: FlangMatchSource, construct_id: int, start: int, end: int
+    ) -> None:
+        self.source = source
+        self.construct_id = construct_id
+        self.start = start
+        self.end = end
+        self._occurence = -1
+
+    @property
+    def occurence(self) -> int:
+        if self._occurence < 0:
+            numbering = self.source.numbering
+            numbering.number()
+
+            if self._occurence < 0:
+                # not a part of any matched tree, e.g. matched again by `rematch`
+                self._occurence = get_next_occurence(
+                    numbering.counters, self.construct_name
+                )
+
+        return self._occurence
+
+    @property
+    def identifier(self) -> str:
+        return "{}[{}]".format(self.source.locations[self.construct_id], self.occurence)
+
+    @property
+    def construct_name(self) -> str:
+        return self.source.locations[self.construct_id]
+
+    @property
+    def span(self) -> tuple[int, int]:
+        return self.start, self.end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.construct_name!r}, {self.start}, {self.end})"
+
+
+class FlangTextSpanMatchObject(FlangSpanMatchObject):
+    __slots__ = ()
+
+    @property
+    def content(self) -> str:
+        return self.source.text[self.start : self.end]
+
+    def get_raw_content(self) -> str:
+        return self.content
+
+
+class FlangComplexSpanMatchObject(FlangSpanMatchObject):
+    __slots__ = ("content",)
+
+    def __init__(
+        self,
+        source: FlangMatchSource,
+        construct_id: int,
+        start: int,
+        end: int,
+        content: list[FlangMatchObject],
+    ) -> None:
+        super().__init__(source, construct_id, start, end)
+        self.content = content
+
+    def get_raw_content(self) -> str:
+        # children are joined instead of slicing the source, as a subtree replaced
+        # by `replace_content` may come from a different source text
+        return "".join(it.get_raw_content() for it in self.content)  # type: ignore
+
+    def replace_content(
+        self, content: list[FlangMatchObject], length_delta: int
+    ) -> FlangComplexSpanMatchObject:
+        match_object = FlangComplexSpanMatchObject(
+            self.source, self.construct_id, self.start, self.end + length_delta, content
+        )
+        match_object._occurence = self._occurence
+        return match_object
+
+
 # kw_only=True is added because we override the old field and add a default value
 @dataclasses.dataclass(kw_only=True)
 class FlangAbstractMatchObject(FlangMatchObject):
@@ -118,5 +296,107 @@ class FlangAbstractMatchObject(FlangMatchObject):
     identifier: None = None
 
 
+def number_match_tree(
+    match_object: FlangMatchObject, counters: OccurenceCounters
+) -> FlangMatchObject:
+    """
+    Numbers identifiers of a match tree in document order. Objects without a number
+    are numbered in place. Objects numbered differently, shared with another tree,
+    are copied together with their ancestors, so the other tree does not change
+    """
+    if isinstance(match_object, FlangSpanMatchObject):
+        location = match_object.construct_name
+        previous_occurence = match_object._occurence
+    elif match_object.identifier is not None:
+        location = match_object.construct_name
+        # identifiers of other objects are only the location until they are numbered
+        previous_occurence = (
+            -1
+            if location == match_object.identifier
+            else int(match_object.identifier[len(location) + 1 : -1])
+        )
+    else:
+        location = None
+        previous_occurence = -1
+
+    occurence = -1 if location is None else get_next_occurence(counters, location)
+    content = match_object.content
+
+    if isinstance(content, list):
+        new_content = [number_match_tree(child, counters) for child in content]
+
+        if all(map(operator.is_, new_content, content)):
+            new_content = content
+    else:
+        new_content = content
+
+    if previous_occurence == occurence and new_content is content:
+        return match_object
+
+    if previous_occurence >= 0 or location is None:
+        match_object = copy.copy(match_object)
+
+    if isinstance(match_object, FlangSpanMatchObject):
+        match_object._occurence = occurence
+    elif location is not None:
+        match_object.identifier = "{}[{}]".format(location, occurence)
+
+    if new_content is not content:
+        match_object.content = new_content
+
+    return match_object
+
+
+# text of compact match objects and the objects, with compact ones replaced by
+# (construct id, start, end) or (construct id, start, end, children) tuples
+PackedMatchObjects = tuple[str | None, list]
+
+
+def pack_match_objects(match_objects: list[FlangMatchObject]) -> PackedMatchObjects:
+    """
+    Form of match objects matched in a single text that does not refer to the
+    source and numbering of the match call, so it can be stored and unpacked into
+    another call. Other objects do not have a shared source and are kept as they are
+    """
+    text = None
+
+    def pack(match_object: FlangMatchObject):
+        nonlocal text
+
+        if not isinstance(match_object, FlangSpanMatchObject):
+            return match_object
+
+        text = match_object.source.text
+        packed = (match_object.construct_id, match_object.start, match_object.end)
+
+        if isinstance(match_object, FlangComplexSpanMatchObject):
+            return (*packed, [pack(child) for child in match_object.content])
+        return packed
+
+    packed_objects = [pack(match_object) for match_object in match_objects]
+    return text, packed_objects
+
+
+def unpack_match_objects(
+    packed_objects: list, source: FlangMatchSource | None
+) -> list[FlangMatchObject]:
+    """Reverse of `pack_match_objects`, compact objects are created from `source`"""
+
+    def unpack(packed) -> FlangMatchObject:
+        if not isinstance(packed, tuple):
+            return packed
+
+        assert source is not None
+
+        if len(packed) == 3:
+            return FlangTextSpanMatchObject(source, *packed)
+
+        construct_id, start, end, children = packed
+        content = [unpack(child) for child in children]
+        return FlangComplexSpanMatchObject(source, construct_id, start, end, content)
+
+    return [unpack(packed) for packed in packed_objects]
+
+
 FlangFileMatch = FlangDirectoryMatchObject | FlangFlatFileMatchObject
 PossibleRootFlangMatch = FlangFileMatch | FlangAbstractMatchObject
@@ -9,10 +9,17 @@ linking_syntax = ["link-definition", "link-from", "scope"]
 def get_possible_construct_attributes(construct_name: str):
 
     match construct_name:
-        case "sequence" | "choice":
+        case "sequence":
             return (
                 naming_attributes + cardinality_attributes + visible_construct_attributes
             )
+        case "choice":
+            return (
+                naming_attributes
+                + cardinality_attributes
+                + visible_construct_attributes
+                + ["mode"]
+            )
         case "text" | "regex":
             return (
                 naming_attributes
@@ -1,5 +1,8 @@
 import functools
+import hashlib
 import itertools
+import os
+import pathlib
 
 VNAME = r"[A-Za-z]\w*"
 INTEGER = r"[0-9]|([1-9][0-9]+)"
@@ -55,6 +58,30 @@ def compose(item, functions_to_apply):
     )
 
 
+def get_cache_root() -> pathlib.Path:
+    if cache_dir := os.environ.get("FIVE_CACHE_DIR"):
+        return pathlib.Path(cache_dir)
+
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(xdg_cache_home) / "five"
+
+
+@functools.cache
+def get_engine_fingerprint() -> str:
+    """
+    Hash of the sources of the flang package. Changes whenever the layout of pickled
+    engine objects might change, so persisted entries from other versions are missed
+    """
+    package_root = pathlib.Path(__file__).parent.parent
+    digest = hashlib.sha256()
+
+    for path in sorted(package_root.rglob("*.py")):
+        digest.update(path.relative_to(package_root).as_posix().encode())
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
 def kebab_to_snake_case(name: str):
     return name.replace("-", "_")
 
@@ -1,8 +1,37 @@
+from typing import Callable
+
+
 # project parsing
 class TextNotParsedError(Exception): ...
 
 
-class MatchNotFoundError(Exception): ...
+class MatchNotFoundError(Exception):
+    """
+    Raised when a construct does not match at a position. Only the construct id and
+    the position are stored, `message` (a string or a function returning one) is
+    filled in when the error reaches the user
+    """
+
+    def __init__(
+        self,
+        construct_id: int = -1,
+        position: int = -1,
+        message: str | Callable[[], str] | None = None,
+    ) -> None:
+        super().__init__(construct_id, position)
+        self.construct_id = construct_id
+        self.position = position
+        self.message = message
+
+    def __str__(self) -> str:
+        if self.message is None:
+            return f"Could not match construct {self.construct_id} at {self.position}"
+
+        return self.message if isinstance(self.message, str) else self.message()
+
+    def __reduce__(self):
+        # the message is formatted before the error is sent to another process
+        return type(self), (self.construct_id, self.position, str(self))
 
 
 class TextMatchNotFound(MatchNotFoundError): ...
@@ -0,0 +1,193 @@
+"""
+Static analysis of regex patterns. FIRST set is the set of characters a pattern
+can start with. `None` means the set is not known (or too big to store)
+"""
+
+import re
+from re import _parser as sre_parse  # type: ignore
+from typing import Iterator
+
+FirstChars = frozenset[str] | None
+
+# character classes bigger than this are not expanded
+MAX_RANGE_SIZE = 1024
+
+
+def _get_in_first_chars(items: list) -> FirstChars:
+    chars = set()
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_parse.RANGE and av[1] - av[0] < MAX_RANGE_SIZE:
+            chars.update(map(chr, range(av[0], av[1] + 1)))
+        else:
+            # negations, categories (\s, \w, ...) and huge ranges
+            return None
+
+    return frozenset(chars)
+
+
+def _get_items_first_chars(items: list) -> tuple[FirstChars, bool]:
+    """Returns the FIRST set of the sequence of items and if it can match nothing"""
+    chars: set[str] = set()
+
+    for op, av in items:
+        match op:
+            case sre_parse.LITERAL:
+                item_chars, item_nullable = frozenset(chr(av)), False
+            case sre_parse.IN:
+                item_chars, item_nullable = _get_in_first_chars(av), False
+            case sre_parse.AT | sre_parse.ASSERT | sre_parse.ASSERT_NOT:
+                # zero-width, so they can only narrow down what follows
+                continue
+            case sre_parse.SUBPATTERN:
+                _, add_flags, _, sub_items = av
+
+                if add_flags & re.IGNORECASE:
+                    return None, False
+
+                item_chars, item_nullable = _get_items_first_chars(sub_items)
+            case (
+                sre_parse.MAX_REPEAT | sre_parse.MIN_REPEAT | sre_parse.POSSESSIVE_REPEAT
+            ):
+                min_count, _, sub_items = av
+                item_chars, item_nullable = _get_items_first_chars(sub_items)
+                item_nullable = item_nullable or min_count == 0
+            case sre_parse.BRANCH:
+                item_chars, item_nullable = frozenset(), False
+
+                for branch_items in av[1]:
+                    branch_chars, branch_nullable = _get_items_first_chars(branch_items)
+
+                    if branch_chars is None:
+                        return None, False
+
+                    item_chars |= branch_chars
+                    item_nullable = item_nullable or branch_nullable
+            case _:
+                return None, False
+
+        if item_chars is None:
+            return None, False
+
+        chars |= item_chars
+
+        if not item_nullable:
+            return frozenset(chars), False
+
+    return frozenset(chars), True
+
+
+def get_pattern_first_chars(pattern: re.Pattern) -> FirstChars:
+    if not isinstance(pattern.pattern, str):
+        return None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    if (pattern.flags | parsed.state.flags) & re.IGNORECASE:
+        return None
+
+    chars, nullable = _get_items_first_chars(list(parsed))
+
+    # patterns matching empty text are always tried
+    return None if nullable else chars
+
+
+def _has_group_references(value) -> bool:
+    if isinstance(value, sre_parse.SubPattern):
+        return any(
+            op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+            or _has_group_references(av)
+            for op, av in value
+        )
+    if isinstance(value, (tuple, list)):
+        return any(_has_group_references(item) for item in value)
+
+    return False
+
+
+def has_group_references(pattern: re.Pattern) -> bool:
+    """
+    Whether the pattern refers to its groups (`\\1`, `(?P=name)`, `(?(1)...)`), so
+    it cannot be embedded into a bigger pattern. Unparsable patterns are assumed to
+    do so
+    """
+    if not pattern.groups:
+        return False
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return True
+
+    return _has_group_references(parsed)
+
+
+_NEGATED_CATEGORIES = (
+    sre_parse.CATEGORY_NOT_DIGIT,
+    sre_parse.CATEGORY_NOT_SPACE,
+    sre_parse.CATEGORY_NOT_WORD,
+    sre_parse.CATEGORY_NOT_LINEBREAK,
+)
+# word boundaries depend on what `\w` matches
+_BOUNDARIES = (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+
+
+def _iter_subpatterns(value) -> Iterator[sre_parse.SubPattern]:
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _iter_subpatterns(item)
+
+
+def _is_ascii_only(items, ascii_classes: bool) -> bool:
+    for op, av in items:
+        match op:
+            case sre_parse.ANY | sre_parse.NOT_LITERAL | sre_parse.NEGATE:
+                return False
+            case sre_parse.LITERAL if av > 127:
+                return False
+            case sre_parse.RANGE if av[1] > 127:
+                return False
+            case sre_parse.CATEGORY if av in _NEGATED_CATEGORIES or not ascii_classes:
+                return False
+            case sre_parse.AT if av in _BOUNDARIES and not ascii_classes:
+                return False
+            case sre_parse.IN:
+                if not _is_ascii_only(av, ascii_classes):
+                    return False
+            case _:
+                for subpattern in _iter_subpatterns(av):
+                    if not _is_ascii_only(subpattern, ascii_classes):
+                        return False
+
+    return True
+
+
+def is_pattern_ascii_only(pattern: re.Pattern) -> bool:
+    """
+    Whether the pattern only matches ASCII characters, so it can run on UTF-8
+    encoded bytes without splitting a multi-byte character (no `.`, negations or
+    non-ASCII characters) and gives the same result there. Classes like `\\w` and
+    `\\b` match Unicode in str patterns, so they are only allowed with `re.ASCII`
+    """
+    if not isinstance(pattern.pattern, str):
+        return False
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return False
+
+    flags = pattern.flags | parsed.state.flags
+
+    # case folding of str patterns covers non-ASCII characters
+    if flags & re.IGNORECASE:
+        return False
+
+    return _is_ascii_only(parsed, ascii_classes=bool(flags & re.ASCII))
@@ -76,6 +76,28 @@ THIS IS WRONG
 </sequence>
 """
 
+TEST_TEMPLATE_CHOICE_MODE = """
+<sequence name="keyword">
+<choice name="keyword-choice" mode="{mode}">
+<text name="short" value="in"/>
+<text name="long" value="int"/>
+<regex name="rest" value="[a-z]+"/>
+</choice>
+<regex name="tail" value="[a-z ]*" optional="true"/>
+</sequence>
+"""
+
+TEST_TEMPLATE_LITERAL_CHOICE = """
+<sequence name="keyword">
+<choice name="keyword-choice" mode="{mode}">
+<text name="short" value="in"/>
+<text name="long" value="int"/>
+<text name="duplicate" value="in"/>
+</choice>
+<regex name="tail" value="[a-z ]*" optional="true"/>
+</sequence>
+"""
+
 # this would be useful with combination of "use" construct
 # f.e.: choice of variable declaration or types or raw values
 TEST_TEMPLATE_CHOICE_NESTED = r"""
@@ -129,6 +151,14 @@ TEST_TEMPLATE_CHOICE_AND_MULTI = r"""
 </sequence>
 """
 
+TEST_TEMPLATE_FUSED = """
+<sequence name="fused">
+<regex name="letters" value="a+"/>
+<text name="separator" value="b" optional="true"/>
+<text value="a"/>
+</sequence>
+"""
+
 TEST_TEMPLATE_USE = """
 <sequence name="import">
 <sequence name="foo" visible="false">
@@ -0,0 +1,309 @@
+import re
+import tempfile
+import unittest
+
+from flang.handlers import FlangProjectAnalyzer
+from flang.parsers import FlangXMLParser
+from flang.structures import (
+    FileTreeScanner,
+    FlangComplexMatchObject,
+    FlangDirectoryMatchObject,
+    FlangFileInputReader,
+    FlangFlatFileMatchObject,
+    FlangMmapInputReader,
+    FlangTextInputReader,
+    FlangTextMatchObject,
+    IntermediateFileObject,
+)
+from flang.utils.exceptions import TextNotParsedError
+
+from . import templates as tpl
+
+
+class FlangInputReaderTestCase(unittest.TestCase):
+    def test_text_reader_matches_in_place(self):
+        source = "hello world"
+        reader = FlangTextInputReader(source)
+        reader.consume_data(FlangTextMatchObject(identifier="hello", content="hello "))
+
+        copied_reader = reader.copy()
+        self.assertEqual(copied_reader.cursor, 6)
+        self.assertIs(copied_reader.previous, reader)
+        self.assertTrue(copied_reader.startswith("world"))
+        self.assertFalse(copied_reader.startswith("hello"))
+
+        self.assertEqual(copied_reader.match_pattern(re.compile(r"\w+")), "world")
+        self.assertIsNone(copied_reader.match_pattern(re.compile(r"\d+")))
+        self.assertEqual(copied_reader.read(3), "wor")
+
+        copied_reader.consume_data(
+            FlangTextMatchObject(identifier="world", content="world")
+        )
+        self.assertTrue(copied_reader.at_end())
+        self.assertFalse(reader.at_end())
+
+    def test_mmap_reader(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".txt") as f:
+            f.write("zażółć 123".encode())
+            f.flush()
+
+            reader = FlangMmapInputReader.from_path(f.name)
+            self.assertTrue(reader.startswith("zażółć"))
+            self.assertEqual(reader.match_pattern(re.compile(r"\S+")), "zażółć")
+
+            word = FlangTextMatchObject(identifier="word", content="zażółć ")
+            reader.consume_data(word)
+            self.assertEqual(reader.cursor, len("zażółć ".encode()))
+            self.assertEqual(reader.match_pattern(re.compile(r"\d+")), "123")
+            self.assertEqual(reader.read(), "123")
+
+            # complex objects carry their span in bytes, the text is not encoded again
+            reader = FlangMmapInputReader.from_path(f.name)
+            span = (0, len(word.content.encode()))
+            sequence = FlangComplexMatchObject(
+                identifier="sequence", content=[word], span=span
+            )
+            reader.consume_data(sequence)
+            self.assertEqual(reader.read(), "123")
+            self.assertEqual(len(sequence), len(word.content))
+
+    def test_replace_content_updates_span(self):
+        word = FlangTextMatchObject(identifier="word", content="abc", span=(4, 7))
+        sequence = FlangComplexMatchObject(
+            identifier="sequence", content=[word], span=(4, 7)
+        )
+        self.assertEqual(len(sequence), 3)
+
+        edited_word = FlangTextMatchObject(identifier="word", content="abcde")
+        edited_sequence = sequence.replace_content([edited_word], 2)
+        self.assertEqual(edited_sequence.span, (4, 9))
+        self.assertEqual(len(edited_sequence), 5)
+        self.assertEqual(sequence.span, (4, 7))
+
+    def test_mmap_threshold_in_file_tree(self):
+        parser = FlangXMLParser()
+        # {number} uses \d, which also matches non-ASCII digits in str patterns
+        template = tpl.TEST_TEMPLATE_FILES_EASY.replace("{number}", "[0-9]+")
+        processor = FlangProjectAnalyzer(parser.parse_text(template))
+        self.assertTrue(processor.project_construct.grammar.bytes_safe)
+        expected = processor.forward_filename(tpl.TEST_SAMPLE_FILES + "/easy")
+
+        default_threshold = IntermediateFileObject.mmap_threshold
+        self.addCleanup(
+            setattr, IntermediateFileObject, "mmap_threshold", default_threshold
+        )
+        IntermediateFileObject.mmap_threshold = 1
+
+        file_object = IntermediateFileObject(tpl.TEST_SAMPLE_FILES + "/easy/index.html")
+        self.assertTrue(file_object.should_use_mmap())
+        reader = file_object.get_input_reader()
+        self.assertIsInstance(reader, FlangMmapInputReader)
+
+        file_object.release()
+        self.assertTrue(reader.data.closed)
+
+        processor = FlangProjectAnalyzer(parser.parse_text(template))
+        matched = processor.forward_filename(tpl.TEST_SAMPLE_FILES + "/easy")
+
+        assert expected is not None and matched is not None
+        self.assertEqual(matched.to_representation(), expected.to_representation())
+
+    def test_mmap_threshold_with_non_ascii_patterns(self):
+        template = r"""
+        <file pattern="*" variant="glob" name="project">
+        <file multi="true" pattern="*.txt" variant="glob">
+        <sequence name="word">
+        <regex name="first" value="."/>
+        <regex name="rest" value="[ó-żw]+"/>
+        </sequence>
+        </file>
+        </file>
+        """
+        project_construct = FlangXMLParser().parse_text(template)
+        # "." and the class would match parts of the encoded characters
+        self.assertFalse(project_construct.grammar.bytes_safe)
+
+        default_threshold = IntermediateFileObject.mmap_threshold
+        self.addCleanup(
+            setattr, IntermediateFileObject, "mmap_threshold", default_threshold
+        )
+        IntermediateFileObject.mmap_threshold = 1
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(directory + "/animal.txt", "w", encoding="utf-8") as f:
+                f.write("żółw")
+
+            file_object = IntermediateFileObject(directory + "/animal.txt")
+            self.assertNotIsInstance(
+                file_object.get_input_reader(allow_mmap=False), FlangMmapInputReader
+            )
+
+            match_object = FlangProjectAnalyzer(project_construct).forward_filename(
+                directory
+            )
+
+        assert match_object is not None
+        word = match_object.to_representation()[1][0][1][0]
+        self.assertEqual([content for _, content in word[1]], ["ż", "ółw"])
+
+    def test_mmap_threshold_with_unicode_classes(self):
+        template = r"""
+        <file pattern="*" variant="glob" name="project">
+        <file multi="true" pattern="*.txt" variant="glob">
+        <sequence name="words">
+        <regex name="first" value="{vname}"/>
+        <text value=" "/>
+        <regex name="second" value="{vname}"/>
+        </sequence>
+        </file>
+        </file>
+        """
+        parser = FlangXMLParser()
+        # \w matches "é" in str patterns, but not in byte patterns
+        self.assertFalse(parser.parse_text(template).grammar.bytes_safe)
+
+        default_threshold = IntermediateFileObject.mmap_threshold
+        self.addCleanup(
+            setattr, IntermediateFileObject, "mmap_threshold", default_threshold
+        )
+        results = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(directory + "/words.txt", "w", encoding="utf-8") as f:
+                f.write("café bar")
+
+            for mmap_threshold in (None, 1):
+                IntermediateFileObject.mmap_threshold = mmap_threshold
+                processor = FlangProjectAnalyzer(parser.parse_text(template))
+                match_object = processor.forward_filename(directory)
+                assert match_object is not None
+                results.append(match_object.to_representation())
+
+        self.assertEqual(*results)
+
+    def test_mmap_failure(self):
+        template = r"""
+        <file pattern="*" variant="glob" name="project">
+        <file multi="true" pattern="*.txt" variant="glob">
+        <regex name="word" value="[a-z]+" multi="true"/>
+        </file>
+        </file>
+        """
+        project_construct = FlangXMLParser().parse_text(template)
+        self.assertTrue(project_construct.grammar.bytes_safe)
+
+        default_threshold = IntermediateFileObject.mmap_threshold
+        self.addCleanup(
+            setattr, IntermediateFileObject, "mmap_threshold", default_threshold
+        )
+        IntermediateFileObject.mmap_threshold = 1
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(directory + "/words.txt", "w", encoding="utf-8") as f:
+                f.write("abc 123")
+
+            # the file is closed before the error message is built
+            with self.assertRaises(TextNotParsedError) as raised:
+                FlangProjectAnalyzer(project_construct).forward_filename(directory)
+
+        self.assertIn('found " 123"', raised.exception.__notes__[0])
+
+    def test_scanner_caches_and_prunes(self):
+        path = tpl.TEST_SAMPLE_FILES + "/hard"
+        scanner = FileTreeScanner(ignore_patterns=["*.md", "styles"])
+
+        listing = scanner.list_directory(path)
+        self.assertIs(scanner.list_directory(path), listing)
+        self.assertEqual(sorted(f.filename for f in listing), ["code", "index.html"])
+
+        code_directory = next(f for f in listing if f.filename == "code")
+        self.assertTrue(code_directory.is_dir)
+        self.assertIs(code_directory.content, code_directory.content)
+
+    def test_forward_filename_ignore_patterns(self):
+        parser = FlangXMLParser()
+        project_construct = parser.parse_text(tpl.TEST_TEMPLATE_FILES_EASY)
+        match_object = FlangProjectAnalyzer(project_construct).forward_filename(
+            tpl.TEST_SAMPLE_FILES + "/easy", ignore_patterns=["404.*"]
+        )
+
+        assert isinstance(match_object, FlangDirectoryMatchObject)
+        self.assertEqual(
+            sorted(f.filename for f in match_object.content), ["index.html", "page.html"]
+        )
+
+    def test_file_content_is_cached_until_released(self):
+        scanner = FileTreeScanner()
+        (index_file,) = [
+            f
+            for f in scanner.list_directory(tpl.TEST_SAMPLE_FILES + "/easy")
+            if f.filename == "index.html"
+        ]
+        self.assertIs(index_file.content, index_file.content)
+
+        index_file.release()
+        self.assertIsNone(index_file._text)
+
+    def test_file_reader_index(self):
+        files = FileTreeScanner().list_directory(tpl.TEST_SAMPLE_FILES + "/easy")
+        reader = FlangFileInputReader(files, filename="easy")
+
+        index_file = reader.find_first_file("index.html", "filename")
+        assert index_file is not None
+        self.assertEqual(index_file.filename, "index.html")
+        self.assertIsNone(reader.find_first_file("missing.html", "filename"))
+        self.assertEqual(len(reader.find_all_files("*.html", "glob")), 3)
+
+        copied_reader = reader.copy()
+        copied_reader.consume_data(
+            FlangFlatFileMatchObject(
+                identifier="index", content=[], filename="index.html"
+            )
+        )
+        self.assertIsNone(copied_reader.find_first_file("index.html", "filename"))
+
+        remaining_files = copied_reader.find_all_files(r".*\.html", "regex")
+        self.assertEqual(
+            sorted(f.filename for f in remaining_files), ["404.html", "page.html"]
+        )
+        self.assertEqual(copied_reader.get_key(), 1)
+        self.assertEqual(len(reader.read()), 3)
+        self.assertFalse(copied_reader.at_end())
+
+    def test_file_reader_lookups_scale_with_files(self):
+        class CountingPositions(tuple):
+            reads = 0
+
+            def __getitem__(self, index):
+                CountingPositions.reads += 1
+                return super().__getitem__(index)
+
+            def __iter__(self):
+                for position in super().__iter__():
+                    CountingPositions.reads += 1
+                    yield position
+
+        file_count = 5000
+        files = [
+            IntermediateFileObject(f"file{i}.html", is_dir=False)
+            for i in range(file_count)
+        ]
+        reader = FlangFileInputReader(files, filename="many")
+        index = reader._index
+        key = ("*.html", "glob")
+        index._matching_positions[key] = CountingPositions(
+            index.find_matching_positions(*key)
+        )
+
+        # consuming every file of a multi glob, like a multi "file" construct
+        while (file_object := reader.find_first_file(*key)) is not None:
+            reader = reader.copy()
+            reader.consume_data(
+                FlangFlatFileMatchObject(
+                    identifier="file", content=[], filename=file_object.filename
+                )
+            )
+
+        self.assertTrue(reader.at_end())
+        # every position is checked a constant number of times, not once per lookup
+        self.assertLessEqual(CountingPositions.reads, 2 * file_count)
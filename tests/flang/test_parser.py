@@ -1,9 +1,23 @@
+import filecmp
+import io
+import pathlib
+import pickle
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from flang.handlers import FlangProjectAnalyzer
 from flang.parsers import FlangXMLParser
-from flang.runtime import ProjectParsingRuntime
-from flang.structures import PossibleRootFlangMatch
+from flang.runtime import MatchFailure, ProjectParsingRuntime
+from flang.structures import (
+    FlangAbstractMatchObject,
+    FlangComplexSpanMatchObject,
+    FlangDirectoryMatchObject,
+    FlangStreamInputReader,
+    FlangTextInputReader,
+    FlangTextSpanMatchObject,
+    PossibleRootFlangMatch,
+)
 from flang.utils.exceptions import MatchNotFoundError, TextNotParsedError
 
 from . import templates as tpl
@@ -39,6 +53,48 @@ class FlangParserTestCase(unittest.TestCase):
         with self.assertRaises(TextNotParsedError):
             self._parse_template(tpl.TEST_BASIC_TEMPLATE, tpl.TEST_BASIC_SAMPLE_FAILURE_2)
 
+    def test_failure_messages(self):
+        with self.assertRaises(MatchNotFoundError) as error_context:
+            self._parse_template(tpl.TEST_BASIC_TEMPLATE, tpl.TEST_BASIC_SAMPLE_FAILURE_1)
+
+        error = error_context.exception
+        self.assertIn('line 1, column 1: expected text "hello "', str(error))
+        # failures discarded inside of the matcher are never formatted
+        assert isinstance(error.__cause__, MatchNotFoundError)
+        self.assertIsNone(error.__cause__.message)
+        self.assertEqual(error.__cause__.position, 0)
+
+        sample = tpl.TEST_SAMPLE_MULTI.replace("someothervalue;", "someothervalue")
+
+        with self.assertRaises(TextNotParsedError) as error_context:
+            self._parse_template(tpl.TEST_TEMPLATE_MULTI, sample)
+
+        self.assertEqual(
+            error_context.exception.__notes__,
+            ['Farthest failure at line 5, column 25: expected regex ";\\n?", found "\n"'],
+        )
+
+    def test_failure_results(self):
+        project_construct = self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE)
+        context = project_construct.create_match_context()
+        grammar = context.grammar
+
+        kinds = [kind.name.lower() for kind in grammar.kinds]
+        self.assertEqual(kinds, list(grammar.names))
+
+        # failures are returned inside of the matcher, only `match` raises them
+        result = project_construct._match_flang_construct(
+            context,
+            grammar.root,
+            FlangTextInputReader(tpl.TEST_BASIC_SAMPLE_FAILURE_1),
+            check_if_all_text_parsed=True,
+        )
+        assert isinstance(result, MatchFailure)
+
+        error = result.to_error()
+        self.assertIsInstance(error, MatchNotFoundError)
+        self.assertEqual(error.construct_id, grammar.root)
+
     def test_choice(self):
         project_construct, match_object = self._parse_template(
             tpl.TEST_TEMPLATE_CHOICE, "AAA"
@@ -55,6 +111,62 @@ class FlangParserTestCase(unittest.TestCase):
         constr = project_construct.get_construct_from_spec(match_object)
         self.assertEqual(constr.name, "regex")
 
+        # alternatives skipped by their first characters are still expected
+        with self.assertRaises(MatchNotFoundError) as error_context:
+            self._parse_template(tpl.TEST_TEMPLATE_CHOICE, "<html>")
+
+        self.assertIn(
+            'line 1, column 1: expected text "AAA" or regex', str(error_context.exception)
+        )
+
+    def test_choice_mode(self):
+        expected_constructs = {"first": "short", "longest": "rest"}
+
+        for mode, expected_construct in expected_constructs.items():
+            project_construct, match_object = self._parse_template(
+                tpl.TEST_TEMPLATE_CHOICE_MODE.format(mode=mode), "integer value"
+            )
+            constr = project_construct.get_construct_from_spec(
+                match_object.first_child.first_child
+            )
+            self.assertEqual(constr.location.split(".")[-1], expected_construct)
+
+    def test_literal_choice(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_CHOICE_NESTED)
+        grammar = project_construct.grammar
+        root = project_construct.root + ".all-pieces"
+
+        self.assertIsNotNone(grammar.literal_choices[grammar.ids[root + ".text-pieces"]])
+        self.assertIsNone(grammar.literal_choices[grammar.ids[root + ".my-regexes"]])
+
+        expected_constructs = {"first": "short", "longest": "long"}
+
+        for mode, expected_construct in expected_constructs.items():
+            template = tpl.TEST_TEMPLATE_LITERAL_CHOICE.format(mode=mode)
+            results = []
+
+            # without precompiled literals every alternative is tried separately
+            for precompile in (True, False):
+                project_construct = self.parser.parse_text(
+                    template, precompile=precompile
+                )
+                processor = FlangProjectAnalyzer(project_construct)
+                match_object = processor.forward_string("integer value")
+                assert match_object is not None
+
+                with self.assertRaises(MatchNotFoundError) as error_context:
+                    processor.forward_string("ix")
+
+                results.append(
+                    (match_object.to_representation(), str(error_context.exception))
+                )
+
+            self.assertEqual(*results)
+            constr = project_construct.get_construct_from_spec(
+                match_object.first_child.first_child
+            )
+            self.assertEqual(constr.location.split(".")[-1], expected_construct)
+
     def test_choice_nested(self):
         self._parse_template(
             tpl.TEST_TEMPLATE_CHOICE_NESTED, tpl.TEST_CHOICE_NESTED_SAMPLE
@@ -68,6 +180,41 @@ class FlangParserTestCase(unittest.TestCase):
     def test_use(self):
         self._parse_template(tpl.TEST_TEMPLATE_USE, "foo")
 
+    def test_compiled_grammar(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_USE)
+        grammar = project_construct.grammar
+
+        self.assertIs(grammar, project_construct.grammar)
+        self.assertEqual(len(grammar), len(project_construct.symbol_table))
+
+        # "foo" is not visible, so "import" has only one child
+        (bar_id,) = grammar.children[grammar.root]
+        (use_id,) = grammar.children[bar_id]
+        target_id = grammar.use_targets[use_id]
+
+        self.assertEqual(grammar.names[use_id], "use")
+        self.assertFalse(grammar.visible[target_id])
+        self.assertEqual(grammar.locations[target_id], project_construct.root + ".foo")
+
+    def test_first_chars(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_CHOICE_NESTED)
+        grammar = project_construct.grammar
+        root = project_construct.root
+
+        text_pieces = grammar.ids[root + ".all-pieces.text-pieces"]
+        self.assertEqual(grammar.first_chars[text_pieces], frozenset("iLwdas"))
+        self.assertFalse(grammar.can_start_with(text_pieces, ","))
+        self.assertFalse(grammar.can_start_with(text_pieces, ""))
+
+        # {number} can start with a minus sign or any digit
+        number = grammar.ids[root + ".all-pieces.my-regexes.number"]
+        self.assertEqual(grammar.first_chars[number], frozenset("-0123456789"))
+
+        # \s is a character category, which is not expanded
+        whitespace = grammar.ids[root + ".all-pieces.my-regexes.whitespace"]
+        self.assertIsNone(grammar.first_chars[whitespace])
+        self.assertTrue(grammar.can_start_with(whitespace, "x"))
+
     def test_multi(self):
         self._parse_template(tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI)
 
@@ -84,6 +231,376 @@ class FlangParserTestCase(unittest.TestCase):
         self._parse_template(tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_2)
         self._parse_template(tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3)
 
+    def test_memoized(self):
+        # expected memo hits for a small table and for one holding every result
+        cases = [
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3, {4: 0, 4096: 3}),
+            # "import" and "function-call" alternatives both start with a {vname} regex
+            (tpl.TEST_TEMPLATE_LINKING, tpl.TEST_SAMPLE_LINKING, {4: 2, 4096: 2}),
+        ]
+
+        for template, sample, expected_hits in cases:
+            for memo_size, hits in expected_hits.items():
+                project_construct = self.parser.parse_text(template)
+                project_construct.enable_memoization(memo_size)
+                context = project_construct.create_match_context()
+
+                match_objects, _ = project_construct.match(
+                    FlangTextInputReader(sample), context
+                )
+                memo = context.memo
+                assert memo is not None
+
+                raw_content = "".join(it.get_raw_content() for it in match_objects)
+                self.assertEqual(raw_content, sample)
+                self.assertLessEqual(len(memo), memo_size)
+                self.assertEqual(memo.hits, hits)
+
+    def test_memo_stats(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_LINKING)
+        memo_stats = project_construct.enable_memoization()
+        processor = FlangProjectAnalyzer(project_construct)
+
+        for _ in range(2):
+            processor.forward_string(tpl.TEST_SAMPLE_LINKING)
+
+        list(processor.iter_forward(FlangTextInputReader(tpl.TEST_SAMPLE_LINKING)))
+
+        self.assertIs(project_construct.memo_stats, memo_stats)
+        self.assertEqual(memo_stats.calls, 3)
+        self.assertEqual(memo_stats.hits, 6)
+        self.assertGreater(memo_stats.misses, 0)
+
+        memo_stats.reset()
+        self.assertEqual(memo_stats.stats()["hits"], 0)
+
+        project_construct.disable_memoization()
+        self.assertIsNone(project_construct.memo_stats)
+
+    def test_precompile_switch(self):
+        cases = [
+            (tpl.TEST_BASIC_TEMPLATE, tpl.TEST_BASIC_SAMPLE),
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI),
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3),
+        ]
+
+        for template, sample in cases:
+            representations = []
+
+            for precompile in (True, False):
+                project_construct = self.parser.parse_text(
+                    template, precompile=precompile
+                )
+                processor = FlangProjectAnalyzer(project_construct)
+                match_object = processor.forward_string(sample)
+                assert match_object is not None
+                representations.append(match_object.to_representation())
+
+            self.assertEqual(*representations)
+
+    def test_fused_sequence(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_FUSED)
+        grammar = project_construct.grammar
+        self.assertIsNotNone(grammar.fused_patterns[grammar.root])
+
+        processor = FlangProjectAnalyzer(project_construct)
+        match_object = processor.forward_string("aaba")
+        assert match_object is not None
+        self.assertEqual(
+            [child.get_raw_content() for child in match_object.first_child.content],
+            ["aa", "b", "a"],
+        )
+
+        # "a+" takes all letters, the pattern does not backtrack into it
+        for reader in (
+            FlangTextInputReader("aaa"),
+            FlangStreamInputReader(io.StringIO("aaa")),
+        ):
+            with self.assertRaises(MatchNotFoundError) as error_context:
+                processor.forward(reader)
+
+            error = str(error_context.exception)
+            self.assertIn('expected text "b" or text "a", found ""', error)
+
+        # inside of the matcher the children are matched again only for the details
+        for detailed_failures, expected_ids in (
+            (False, [grammar.root]),
+            (True, list(grammar.children[grammar.root][1:])),
+        ):
+            context = project_construct.create_match_context(detailed_failures)
+            result = project_construct._match_construct(
+                context, grammar.root, FlangTextInputReader("aaa")
+            )
+            assert isinstance(result, MatchFailure)
+            self.assertEqual(context.coarse_failures, not detailed_failures)
+            self.assertEqual(context.farthest_construct_ids, expected_ids)
+
+        for sample in (tpl.TEST_OPTIONAL_SAMPLE_1, tpl.TEST_OPTIONAL_SAMPLE_2):
+            _, match_object = self._parse_template(tpl.TEST_TEMPLATE_OPTIONAL, sample)
+            project_construct = self.parser.parse_text(
+                tpl.TEST_TEMPLATE_OPTIONAL, precompile=False
+            )
+            expected = FlangProjectAnalyzer(project_construct).forward_string(sample)
+            assert expected is not None
+            self.assertEqual(
+                match_object.to_representation(), expected.to_representation()
+            )
+
+    def test_leaf_repetitions(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_MULTI)
+        grammar = project_construct.grammar
+        header_text = grammar.children[grammar.ids[project_construct.root + ".header"]][0]
+        self.assertIsNotNone(grammar.repeat_patterns[header_text])
+
+        cases = [
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI),
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI.replace("AAA\n", "AAAA\n")),
+            (tpl.TEST_TEMPLATE_CHOICE_AND_MULTI, tpl.TEST_CHOICE_AND_MULTI_SAMPLE),
+        ]
+
+        for template, sample in cases:
+            results = []
+
+            # without precompiled patterns every repetition is matched separately
+            for precompile in (True, False):
+                project_construct = self.parser.parse_text(
+                    template, precompile=precompile
+                )
+                processor = FlangProjectAnalyzer(project_construct)
+
+                try:
+                    match_object = processor.forward_string(sample)
+                    assert match_object is not None
+                    results.append(match_object.to_representation())
+                except (MatchNotFoundError, TextNotParsedError) as e:
+                    results.append((str(e), getattr(e, "__notes__", None)))
+
+            self.assertEqual(*results)
+
+    def test_iter_forward(self):
+        cases = [
+            (tpl.TEST_TEMPLATE_CHOICE_AND_MULTI, tpl.TEST_CHOICE_AND_MULTI_SAMPLE),
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3),
+        ]
+
+        for template, sample in cases:
+            _, expected = self._parse_template(template, sample)
+
+            processor = FlangProjectAnalyzer(self.parser.parse_text(template))
+            reader = FlangStreamInputReader(
+                io.StringIO(sample), chunk_size=4, lookahead=32
+            )
+            match_objects = processor.iter_forward(reader)
+
+            # the first object is available before the rest of the input is matched
+            first = next(match_objects)
+            self.assertEqual(
+                first.to_representation(), expected.first_child.to_representation()
+            )
+            self.assertEqual(
+                [first.to_representation()]
+                + [it.to_representation() for it in match_objects],
+                [it.to_representation() for it in expected.content],
+            )
+
+        with self.assertRaises(TextNotParsedError):
+            processor = FlangProjectAnalyzer(
+                self.parser.parse_text(tpl.TEST_TEMPLATE_CHOICE_AND_MULTI)
+            )
+            list(processor.iter_forward_stream(io.StringIO("My name is Tom.\nfoo")))
+
+    def test_iter_forward_failure(self):
+        template = """
+        <choice name="root" multi="true">
+            <sequence name="s">
+                <text value="a"/>
+                <text value="b" optional="true"/>
+            </sequence>
+            <text name="c" value="c"/>
+        </choice>
+        """
+        processor = FlangProjectAnalyzer(self.parser.parse_text(template))
+
+        with self.assertRaises(TextNotParsedError) as expected:
+            processor.forward_string("acacX")
+
+        with self.assertRaises(TextNotParsedError) as streamed:
+            list(processor.iter_forward_stream(io.StringIO("acacX"), chunk_size=1))
+
+        self.assertIn('or text "c", found "X"', expected.exception.__notes__[0])
+        self.assertIn('or text "c", found "X"', streamed.exception.__notes__[0])
+        self.assertEqual(str(streamed.exception), str(expected.exception))
+
+    def test_span_match_objects(self):
+        _, match_object = self._parse_template(
+            tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI
+        )
+        sequence = match_object.first_child
+        leaf = sequence.first_child.first_child
+
+        self.assertIsInstance(sequence, FlangComplexSpanMatchObject)
+        self.assertIsInstance(leaf, FlangTextSpanMatchObject)
+        self.assertFalse(hasattr(leaf, "__dict__"))
+        self.assertEqual((leaf.start, leaf.end), (0, 3))
+        self.assertEqual(leaf.content, "AAA")
+        self.assertEqual(sequence.get_raw_content(), tpl.TEST_SAMPLE_MULTI)
+        self.assertEqual(len(sequence), len(tpl.TEST_SAMPLE_MULTI))
+
+        unpickled = pickle.loads(pickle.dumps(match_object))
+        self.assertEqual(unpickled.to_representation(), match_object.to_representation())
+
+    def test_lazy_identifiers(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_RECURSIVE)
+        processor = FlangProjectAnalyzer(project_construct)
+        first = processor.forward_string(tpl.TEST_SAMPLE_RECURSIVE_3)
+        second = processor.forward_string(tpl.TEST_SAMPLE_RECURSIVE_3)
+        assert first is not None and second is not None
+
+        # nothing is numbered until an identifier is read
+        node = first.first_child
+        assert isinstance(node, FlangComplexSpanMatchObject)
+        self.assertEqual(node.source.numbering.counters, {})
+        self.assertEqual(node.identifier, node.construct_name + "[0]")
+
+        # numbering is scoped to a single match call
+        self.assertEqual(first.to_representation(), second.to_representation())
+
+        # and does not depend on the order in which identifiers are read
+        third = processor.forward_string(tpl.TEST_SAMPLE_RECURSIVE_3)
+        assert third is not None
+        last = third.content[-1]
+        self.assertEqual(last.identifier, first.content[-1].identifier)
+        self.assertEqual(third.to_representation(), first.to_representation())
+
+    def test_forward_many(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_FILES_XML)
+        processor = FlangProjectAnalyzer(project_construct)
+        path = pathlib.Path(tpl.TEST_SAMPLE_FILES) / "xml"
+        expected = processor.forward_filename(str(path))
+        assert expected is not None
+
+        for jobs in (1, 2):
+            results = dict(processor.forward_many([path, path / "missing"], jobs=jobs))
+
+            self.assertEqual(
+                results[path].to_representation(), expected.to_representation()
+            )
+            self.assertIsInstance(results[path / "missing"], Exception)
+
+        processor = FlangProjectAnalyzer(self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE))
+        samples = [tpl.TEST_BASIC_SAMPLE, tpl.TEST_BASIC_SAMPLE_FAILURE_1] * 5
+        results = list(processor.forward_many(samples, jobs=2))
+
+        self.assertCountEqual([sample for sample, _ in results], samples)
+
+        for sample, result in results:
+            if sample == tpl.TEST_BASIC_SAMPLE:
+                assert isinstance(result, FlangAbstractMatchObject)
+                self.assertEqual(result.first_child.get_raw_content(), sample)
+            else:
+                self.assertIsInstance(result, MatchNotFoundError)
+
+    def test_concurrent_matches(self):
+        samples = [
+            tpl.TEST_SAMPLE_RECURSIVE_1,
+            tpl.TEST_SAMPLE_RECURSIVE_2,
+            tpl.TEST_SAMPLE_RECURSIVE_3,
+        ] * 10
+        # a single runtime is shared by all threads
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_RECURSIVE)
+        project_construct.enable_memoization(64)
+        processor = FlangProjectAnalyzer(project_construct)
+
+        def forward(sample: str) -> tuple:
+            match_object = processor.forward_string(sample)
+            assert match_object is not None
+            return match_object.to_representation()
+
+        expected = [forward(sample) for sample in samples]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(forward, samples)), expected)
+
+    def test_forward_edit(self):
+        cases = [
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI, "somevalue", "xyz"),
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI, "AAA\nAAAAAA", "A"),
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI, "value;", " "),
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3, "fancy", "x"),
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3, "nested", "<b>"),
+        ]
+
+        for template, sample, deleted, inserted in cases:
+            _, previous = self._parse_template(template, sample)
+            processor = FlangProjectAnalyzer(self.parser.parse_text(template))
+            offset = sample.index(deleted) + 1
+            new_sample = sample[:offset] + inserted + sample[offset + len(deleted) :]
+
+            try:
+                expected = processor.forward_string(new_sample)
+            except MatchNotFoundError:
+                with self.assertRaises(MatchNotFoundError):
+                    processor.forward_edit(previous, offset, len(deleted), inserted)
+                continue
+
+            assert expected is not None
+            result = processor.forward_edit(previous, offset, len(deleted), inserted)
+            assert isinstance(result, FlangAbstractMatchObject)
+            self.assertEqual(result.to_representation(), expected.to_representation())
+
+        # objects outside of the edited subtree are shared with the previous tree
+        _, previous = self._parse_template(tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI)
+        processor = FlangProjectAnalyzer(self.parser.parse_text(tpl.TEST_TEMPLATE_MULTI))
+        offset = tpl.TEST_SAMPLE_MULTI.index("somevalue") + 1
+        result = processor.forward_edit(previous, offset, 3, "AME")
+        assert isinstance(result, FlangAbstractMatchObject)
+
+        header, first_variable, second_variable = (
+            previous.first_child.content[0],
+            previous.first_child.content[-2],
+            previous.first_child.content[-1],
+        )
+        self.assertIs(result.first_child.content[0], header)
+        self.assertIs(result.first_child.content[-1], second_variable)
+        self.assertIsNot(result.first_child.content[-2], first_variable)
+        self.assertEqual(result.first_child.content[-2].content[1].content, "sAMEvalue")
+
+        with self.assertRaises(ValueError):
+            processor.forward_edit(previous, len(tpl.TEST_SAMPLE_MULTI), 1, "")
+
+    def test_backward(self):
+        for template, sample in [
+            (tpl.TEST_TEMPLATE_MULTI, tpl.TEST_SAMPLE_MULTI),
+            (tpl.TEST_TEMPLATE_RECURSIVE, tpl.TEST_SAMPLE_RECURSIVE_3),
+        ]:
+            project_construct, match_object = self._parse_template(template, sample)
+            processor = FlangProjectAnalyzer(project_construct)
+
+            reader = processor.backward(match_object)
+            assert reader is not None
+            self.assertEqual(reader.read(), sample)
+
+            output = io.StringIO()
+            self.assertIsNone(processor.backward(match_object, output))
+            self.assertEqual(output.getvalue(), sample)
+
+        path = tpl.TEST_SAMPLE_FILES + "/xml"
+        project_construct, match_object = self._parse_template(
+            tpl.TEST_TEMPLATE_FILES_XML, path, file=True
+        )
+        processor = FlangProjectAnalyzer(project_construct)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_path = pathlib.Path(output_dir) / "xml"
+            processor.backward(match_object, output_path, jobs=2)
+
+            comparison = filecmp.dircmp(path, output_path)
+            self.assertEqual(comparison.left_only + comparison.right_only, [])
+            _, mismatch, errors = filecmp.cmpfiles(
+                path, output_path, comparison.common_files, shallow=False
+            )
+            self.assertEqual(mismatch + errors, [])
+
     def test_linking(self):
         self._parse_template(tpl.TEST_TEMPLATE_LINKING, tpl.TEST_SAMPLE_LINKING)
 
@@ -97,6 +614,39 @@ class FlangParserTestCase(unittest.TestCase):
             tpl.TEST_TEMPLATE_FILES_XML, tpl.TEST_SAMPLE_FILES + "/xml", True
         )
 
+    def test_file_parallel(self):
+        cases = [
+            (tpl.TEST_TEMPLATE_FILES_EASY, tpl.TEST_SAMPLE_FILES + "/easy"),
+            (tpl.TEST_TEMPLATE_FILES_XML, tpl.TEST_SAMPLE_FILES + "/xml"),
+        ]
+
+        for template, path in cases:
+            results = []
+
+            for jobs in (1, 2):
+                project_construct = self.parser.parse_text(template)
+                project_construct.jobs = jobs
+                match_object = FlangProjectAnalyzer(project_construct).forward_filename(
+                    path
+                )
+                assert isinstance(match_object, FlangDirectoryMatchObject)
+                results.append(match_object.to_representation())
+
+            self.assertEqual(*results)
+
+            # identifiers of objects matched in different files do not collide
+            identifiers = []
+            stack = [results[-1]]
+
+            while stack:
+                identifier, content = stack.pop()
+                identifiers.append(identifier)
+
+                if isinstance(content, list):
+                    stack += content
+
+            self.assertEqual(len(identifiers), len(set(identifiers)))
+
     def test_file_medium(self):
         ...
         # self._parse_template(
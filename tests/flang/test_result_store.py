@@ -0,0 +1,64 @@
+import pickle
+import tempfile
+import unittest
+
+from flang.handlers import FlangProjectAnalyzer
+from flang.parsers import FlangXMLParser
+from flang.runtime import MatchResultStore
+
+from . import templates as tpl
+
+
+class MatchResultStoreTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        self.store_path = store_dir.name + "/results.sqlite"
+        self.parser = FlangXMLParser()
+
+    def _forward(self, store: MatchResultStore | None, template: str, path: str):
+        project_construct = self.parser.parse_text(template)
+        project_construct.result_store = store
+        match_object = FlangProjectAnalyzer(project_construct).forward_filename(path)
+
+        assert match_object is not None
+        return match_object.to_representation()
+
+    def test_unchanged_files_are_not_parsed_again(self):
+        store = MatchResultStore(self.store_path)
+        self.addCleanup(store.close)
+        path = tpl.TEST_SAMPLE_FILES + "/xml"
+
+        first_result = self._forward(store, tpl.TEST_TEMPLATE_FILES_XML, path)
+        self.assertEqual(store.stats()["entries"], 3)
+        self.assertEqual((store.hits, store.misses), (0, 3))
+
+        # stored objects are numbered together with the rest of the tree
+        second_result = self._forward(store, tpl.TEST_TEMPLATE_FILES_XML, path)
+        self.assertEqual(second_result, first_result)
+        self.assertEqual(
+            second_result, self._forward(None, tpl.TEST_TEMPLATE_FILES_XML, path)
+        )
+        self.assertEqual((store.hits, store.misses), (3, 3))
+
+        # entries do not refer to the source or numbering of the match call
+        for (value,) in store.connection.execute("SELECT value FROM results"):
+            text, packed_objects = pickle.loads(value)
+            self.assertIsInstance(text, str)
+            self.assertTrue(all(isinstance(it, tuple) for it in packed_objects))
+
+        # results of another template are stored separately
+        easy_path = tpl.TEST_SAMPLE_FILES + "/easy"
+        self._forward(store, tpl.TEST_TEMPLATE_FILES_EASY, easy_path)
+        self.assertEqual(store.misses, 6)
+
+    def test_eviction(self):
+        store = MatchResultStore(self.store_path, max_bytes=1)
+        self.addCleanup(store.close)
+
+        easy_path = tpl.TEST_SAMPLE_FILES + "/easy"
+        self._forward(store, tpl.TEST_TEMPLATE_FILES_EASY, easy_path)
+        stats = store.stats()
+
+        self.assertEqual(stats["evictions"], 3)
+        self.assertEqual(stats["entries"], 0)
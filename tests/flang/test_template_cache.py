@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+
+from flang.handlers import FlangProjectAnalyzer
+from flang.parsers import CompiledTemplateCache, FlangXMLParser
+
+from . import templates as tpl
+
+
+class CompiledTemplateCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        self.cache = CompiledTemplateCache(cache_dir.name)
+        self.parser = FlangXMLParser(cache=self.cache)
+
+    def _get_entries(self):
+        return list(self.cache.cache_dir.glob("*.pickle"))
+
+    def test_cached_runtime_is_reused(self):
+        project_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_RECURSIVE, path="t")
+        self.assertEqual(len(self._get_entries()), 1)
+
+        cached_construct = self.parser.parse_text(tpl.TEST_TEMPLATE_RECURSIVE, path="t")
+        self.assertIsNot(cached_construct, project_construct)
+        self.assertEqual(cached_construct.grammar, project_construct.grammar)
+
+        match_object = FlangProjectAnalyzer(cached_construct).forward_string(
+            tpl.TEST_SAMPLE_RECURSIVE_2
+        )
+        self.assertIsNotNone(match_object)
+
+        # different options result in a different entry
+        self.parser.parse_text(tpl.TEST_TEMPLATE_RECURSIVE, path="t", precompile=False)
+        self.assertEqual(len(self._get_entries()), 2)
+
+    def test_corrupted_entry_is_recompiled(self):
+        self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE, path="t")
+        (entry,) = self._get_entries()
+        entry.write_bytes(b"not a pickle")
+        self.assertIsNone(self.cache.load(entry.stem))
+        self.assertFalse(entry.exists())
+
+        entry.write_bytes(b"not a pickle")
+        project_construct = self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE, path="t")
+        FlangProjectAnalyzer(project_construct).forward_string(tpl.TEST_BASIC_SAMPLE)
+        self.assertIsNotNone(self.cache.load(entry.stem))
+
+    def test_entry_with_old_layout_is_recompiled(self):
+        project_construct = self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE, path="t")
+        (entry,) = self._get_entries()
+
+        # an entry pickled before an attribute of the runtime was added
+        del project_construct.result_store
+        self.cache.store(entry.stem, project_construct)
+        self.assertIsNone(self.cache.load(entry.stem))
+        self.assertFalse(entry.exists())
+
+        # an entry pickled before a field of the grammar was added
+        project_construct = self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE, path="t")
+        object.__delattr__(project_construct.grammar, "repeat_patterns")
+        self.cache.store(entry.stem, project_construct)
+        self.assertIsNone(self.cache.load(entry.stem))
+        self.assertFalse(entry.exists())
+
+        project_construct = self.parser.parse_text(tpl.TEST_BASIC_TEMPLATE, path="t")
+        FlangProjectAnalyzer(project_construct).forward_string(tpl.TEST_BASIC_SAMPLE)
+        self.assertIsNotNone(self.cache.load(entry.stem))